@@ -0,0 +1,144 @@
+# Final audio track: the voice (optionally only the kept ranges), loudness-normalized and
+# mixed with looped background music that ducks under speech, encoded to AAC once and cached
+# by source content + mix settings, so renders stream-copy it instead of re-encoding.
+# Loudness is measured once per file (loudnorm analysis) and cached, so normalization is a
+# single linear pass rather than a two-pass loudnorm on every render.
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import render_cache
+
+# Bump when the mix graph changes
+FORMAT = 1
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _key_lock(key):
+    with _locks_lock: return _locks.setdefault(key, threading.Lock())
+
+def measure_loudness(path):
+    # loudnorm analysis ({'input_i', 'input_tp', 'input_lra', 'input_thresh', ...} as floats), cached per file content
+    key = render_cache.file_digest(path)
+    cache_path = os.path.join(render_cache.cache_dir("loudness"), key + ".json")
+    try:
+        with open(cache_path, 'r', encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError):
+        pass
+    res = subprocess.run(['ffmpeg', '-hide_banner', '-nostats', '-i', path, '-vn', '-af', 'loudnorm=print_format=json', '-f', 'null', '-'],
+                         capture_output=True, text=True, errors="replace")
+    m = re.search(r"\{[^{}]*\"input_i\"[^{}]*\}", res.stderr)
+    if res.returncode != 0 or not m: raise RuntimeError(f"loudness analysis failed for {path}")
+    stats = {}
+    for k, v in json.loads(m.group(0)).items():
+        try: stats[k] = float(v)
+        except ValueError: stats[k] = v
+    tmp = cache_path + ".tmp"
+    with open(tmp, 'w', encoding="utf-8") as f: json.dump(stats, f)
+    os.replace(tmp, cache_path)
+    return stats
+
+def _finite(value):
+    return isinstance(value, float) and value not in (float("inf"), float("-inf"))
+
+def atempo(speed):
+    # atempo takes 0.5..2.0 on older ffmpeg builds, so larger factors are chained
+    parts = []
+    while speed > 2.0:
+        parts.append("atempo=2.0")
+        speed /= 2.0
+    parts.append(f"atempo={speed:.4f}")
+    return ", ".join(parts)
+
+def range_graph(speeds, first_input=0):
+    # Voice pieces (inputs first_input, first_input+1, ...) at their speeds, joined in order;
+    # an unterminated chain, so callers append ", ..." or " [label]"
+    parts, labels = [], ""
+    for k, speed in enumerate(speeds):
+        if speed == 1: labels += f"[{first_input + k}:a]"; continue
+        parts.append(f"[{first_input + k}:a] {atempo(speed)} [piece{k}]; ")
+        labels += f"[piece{k}]"
+    return "".join(parts) + labels + (f" concat=n={len(speeds)}:v=0:a=1" if len(speeds) > 1 else " anull")
+
+def mix_graph(speeds, music_input=None, voice_stats=None, voice_lufs=None, music_gain_db=0.0, music_offset=0.0, duck=True):
+    # Filter graph from the voice pieces (inputs 0.., one per speed) and optional music_input to [aout]
+    fmt = "aresample=48000, aformat=sample_fmts=fltp:channel_layouts=stereo"
+    voice = range_graph(speeds) + ", " + fmt
+    if voice_lufs is not None and voice_stats and _finite(voice_stats.get('input_i')):
+        # Linear normalization from the cached measurement (one pass)
+        voice += (f", loudnorm=I={voice_lufs}:TP=-1.5:LRA=11:measured_I={voice_stats['input_i']}:measured_TP={voice_stats['input_tp']}"
+                  f":measured_LRA={voice_stats['input_lra']}:measured_thresh={voice_stats['input_thresh']}:linear=true, {fmt}")
+    if music_input is None: return voice + " [aout]"
+    lines = [voice + (" [voice_in]; [voice_in] asplit=2 [voice][sc]" if duck else " [voice]")]
+    lines.append(f"[{music_input}:a] atrim=start={music_offset:.3f}, asetpts=PTS-STARTPTS, {fmt}, volume={music_gain_db:.2f}dB [bgm]")
+    if duck:
+        # The music is compressed by the voice level: quiet under speech, back up in pauses
+        lines.append("[bgm][sc] sidechaincompress=threshold=0.02:ratio=8:attack=20:release=400 [ducked]")
+        lines.append("[voice][ducked] amix=inputs=2:duration=first:normalize=0 [aout]")
+    else:
+        lines.append("[voice][bgm] amix=inputs=2:duration=first:normalize=0 [aout]")
+    return "; ".join(lines)
+
+def final_audio(voice, ranges=None, limit=None, music=None, music_offset=0.0, voice_lufs=None, music_lufs=-28.0,
+                duck=True, bitrate="128k", max_bytes=2 * 1024 ** 3, log=print):
+    # -> path of the cached AAC track for this voice file and mix, encoding it if needed
+    music_digest = render_cache.file_digest(music) if music else None
+    key = render_cache.text_digest(FORMAT, render_cache.file_digest(voice), ranges, limit, music_digest, round(music_offset, 3),
+                                   voice_lufs, music_lufs if music else None, duck if music else None, bitrate)
+    directory = render_cache.cache_dir("audio")
+    path = os.path.join(directory, key + ".m4a")
+    with _key_lock(key):
+        if os.path.exists(path):
+            render_cache.touch(path)
+            log("[Audio] Using cached audio track")
+            return path
+
+        # ranges are (start, end) or (start, end, speed) in source seconds
+        inputs = []
+        if ranges:
+            for start, end, *_ in ranges: inputs.extend(['-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', voice])
+        else:
+            inputs.extend([*(['-t', f"{limit:.3f}"] if limit else []), '-i', voice])
+        speeds = [r[2] if len(r) > 2 else 1.0 for r in ranges] if ranges else [1.0]
+        n_voice = len(speeds)
+        music_input, music_gain = None, 0.0
+        if music:
+            inputs.extend(['-stream_loop', '-1', '-i', music])
+            music_input = n_voice
+            level = measure_loudness(music).get('input_i')
+            music_gain = music_lufs - level if _finite(level) else 0.0
+        voice_stats = measure_loudness(voice) if voice_lufs is not None else None
+        graph = mix_graph(speeds, music_input, voice_stats, voice_lufs, music_gain, music_offset, duck)
+
+        log(f"[Audio] Encoding audio track{' with background music' if music else ''}...")
+        tmp = os.path.join(directory, key + ".part.m4a")
+        res = subprocess.run(['ffmpeg', '-y', '-v', 'error', *inputs, '-filter_complex', graph, '-map', '[aout]',
+                              '-c:a', 'aac', '-b:a', bitrate, tmp], capture_output=True, text=True, errors="replace")
+        if res.returncode != 0:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise RuntimeError(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else "audio encode failed")
+        os.replace(tmp, path)
+    render_cache.prune(directory, max_bytes)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audio cache tools")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("loudness", help="show (cached) loudness of a file")
+    p.add_argument("path")
+    sub.add_parser("clear", help="remove cached audio tracks and loudness measurements")
+    args = parser.parse_args(argv)
+    if args.action == "clear":
+        removed = render_cache.clear(render_cache.cache_dir("audio")) + render_cache.clear(render_cache.cache_dir("loudness"))
+        print(f"Removed {removed} cached files")
+        return 0
+    stats = measure_loudness(args.path)
+    print(f"{stats['input_i']} LUFS integrated, {stats['input_tp']} dBTP true peak, {stats['input_lra']} LU range")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# Headless batch rendering: a job queue over many project directories, usable from the
+# command line or from the GUI. Every job renders in its own work directory; Whisper runs
+# on its own workers so transcription never holds an encode slot, and concurrent ffmpeg
+# encodes are capped by core count (and by the NVENC session limit when encoding on GPU).
+import argparse
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import render_trace
+from concurrent.futures import ThreadPoolExecutor
+from video_engine import VideoRenderer, parse_ranges
+from transcription import TranscriptionWorker
+
+# Consumer NVIDIA drivers allow a limited number of simultaneous NVENC sessions
+NVENC_SESSIONS = 3
+
+def load_settings(path="settings.conf"):
+    if not os.path.exists(path): return {}
+    with open(path, 'r') as f: return json.load(f)
+
+def apply_settings(renderer, data):
+    # settings.conf keys (as saved by the GUI) -> renderer attributes
+    if "cam_scale" in data:
+        renderer.cam_scale_w = int(data["cam_scale"])
+        renderer.cam_scale_h = int(renderer.cam_scale_w * (9/16))
+    mapping = {"cursor_scale": "cursor_scale", "cam_shape": "cam_shape", "cam_feather": "cam_feather", "cam_pos": "cam_position",
+               "enable_caption": "enable_caption", "use_faster": "use_faster_whisper", "whisper_model": "whisper_model",
+               "font_name": "caption_font", "font_size": "caption_size", "cap_pos": "caption_pos", "chunked": "chunked", "incremental": "incremental",
+               "parallel_whisper": "whisper_parallel", "whisper_workers": "whisper_workers",
+               "whisper_threads": "whisper_threads", "whisper_chunk_seconds": "whisper_chunk_seconds",
+               "auto_tune": "auto_tune", "tune_min_ssim": "tune_min_ssim", "music_duck": "music_duck", "music_lufs": "music_lufs",
+               "voice_lufs": "voice_lufs", "cache_audio": "cache_audio", "audio_bitrate": "audio_bitrate",
+               "jump_cut_min": "jump_cut_min", "jump_cut_padding": "jump_cut_padding", "jump_cut_speed": "jump_cut_speed",
+               "stream_segment_seconds": "stream_segment_seconds"}
+    for key, attr in mapping.items():
+        if key in data: setattr(renderer, attr, data[key])
+    if "cursor_sendcmd" in data: renderer.cursor_mode = "sendcmd" if data["cursor_sendcmd"] else "expr"
+    if "music_file" in data: renderer.music_file = data["music_file"] or None
+    if "jump_cuts" in data: renderer.jump_cuts = data["jump_cuts"] or None
+    if "stream_output" in data: renderer.stream_output = data["stream_output"] or None
+    # "1920x1080" (or a bare width); empty keeps the display's size / frame rate
+    if data.get("output_resolution"):
+        w, _, h = str(data["output_resolution"]).lower().partition("x")
+        renderer.output_width, renderer.output_height = int(w) if w else None, int(h) if h else None
+    if data.get("output_fps"): renderer.output_fps = float(data["output_fps"])
+    if data.get("renditions"):
+        renditions = data["renditions"]
+        renderer.renditions = [r.strip() for r in renditions.split(",") if r.strip()] if isinstance(renditions, str) else renditions
+    # "0:10-1:30, 5:00-6:00" as typed in the GUI, or a list of [start, end] seconds
+    if data.get("keep_ranges"):
+        ranges = data["keep_ranges"]
+        renderer.keep_ranges = parse_ranges(ranges) if isinstance(ranges, str) else [tuple(r) for r in ranges]
+    return renderer
+
+def find_projects(root):
+    # A folder is a project if it has segments/; otherwise look one level down
+    if os.path.isdir(os.path.join(root, 'segments')): return [root]
+    return sorted(os.path.join(root, d) for d in os.listdir(root) if os.path.isdir(os.path.join(root, d, 'segments')))
+
+class BatchQueue:
+    def __init__(self, settings=None, out_dir="renders", max_encodes=None, whisper_workers=1,
+                 nvenc_sessions=NVENC_SESSIONS, status=None, duration_limit=None, transcribers=None):
+        self.settings = settings or {}
+        self.out_dir = out_dir
+        self.max_encodes = max_encodes
+        self.whisper_workers = whisper_workers
+        self.nvenc_sessions = nvenc_sessions
+        self.duration_limit = duration_limit
+        self.status = status or (lambda line: print(line, flush=True))
+        self.jobs = []
+        # Trace reports of finished renders, summed into one record when the batch ends
+        self.traces = []
+        self._lock = threading.Lock()
+        # Whisper worker processes (models stay loaded across jobs); started here unless the caller owns them
+        self._owns_transcribers = transcribers is None
+        self.transcribers = transcribers if transcribers is not None else [TranscriptionWorker() for _ in range(max(1, whisper_workers))]
+        self._idle_transcribers = queue.Queue()
+        for w in self.transcribers: self._idle_transcribers.put(w)
+
+    def add(self, project_dir):
+        job = {'id': len(self.jobs), 'project': os.path.abspath(project_dir), 'state': 'queued'}
+        self.jobs.append(job)
+        self._emit(job)
+        return job['id']
+
+    def _emit(self, job, **extra):
+        record = {'time': time.time(), 'job': job['id'], 'project': job['project'], 'state': job['state'], **extra}
+        with self._lock: self.status(json.dumps(record))
+
+    def _set_state(self, job, state, **extra):
+        job['state'] = state
+        self._emit(job, **extra)
+
+    def _encode_budget(self):
+        # ffmpeg encodes the whole batch may run at once (jobs x their chunk/segment workers)
+        return self.max_encodes or max(1, (os.cpu_count() or 2) // 4)
+
+    def _encode_slots(self, has_nvenc):
+        slots = self._encode_budget()
+        if has_nvenc: slots = min(slots, self.nvenc_sessions)
+        return slots
+
+    def _share_budget(self, renderer, slots):
+        # Each concurrent job gets an equal share of the encodes and NVENC sessions, so chunked and
+        # multi-segment jobs don't start their own cpus//4 encoders on top of the other jobs'
+        share = max(1, self._encode_budget() // slots)
+        renderer.chunk_workers = renderer.segment_workers = share
+        renderer.nvenc_sessions = max(1, self.nvenc_sessions // slots)
+
+    def _prepare(self, job):
+        name = os.path.basename(job['project'].rstrip(os.sep)) or "project"
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        job['work_dir'] = os.path.join(self.out_dir, f"{name}_{job['id']:03d}_{stamp}")
+        os.makedirs(job['work_dir'], exist_ok=True)
+        renderer = apply_settings(VideoRenderer(job['project']), self.settings)
+        renderer.work_dir = job['work_dir']
+        renderer.progress_callback = self._progress_for(job)
+        # Streaming output: every finished segment is a status record, so an uploader can follow along
+        renderer.segment_callback = lambda info: self._emit(job, event='segment', **info)
+        renderer.trace_callback = lambda report: self._trace_done(job, report)
+        job['renderer'] = renderer
+        job['output'] = os.path.join(job['work_dir'], f"{name}.mp4")
+
+    def _trace_done(self, job, report):
+        with self._lock: self.traces.append(report)
+        self._emit(job, event='trace', trace=render_trace.report_path(job['output']), wall_s=report['wall_s'],
+                   stages=render_trace.totals(report))
+
+    def _log_for(self, job):
+        return lambda msg: self._emit(job, event='log', msg=msg.strip())
+
+    def _progress_for(self, job, interval=2.0):
+        # Progress records are rarer than the renderer's events to keep the status stream readable
+        last = [0.0]
+        def emit(p):
+            now = time.time()
+            if p.done or now - last[0] >= interval:
+                last[0] = now
+                self._emit(job, event='progress', **p.as_dict())
+        return emit
+
+    def _transcribe(self, job):
+        # Whisper workers: fill renderer.transcripts so the encode step skips transcription
+        renderer = job['renderer']
+        self._set_state(job, 'transcribing')
+        renderer.transcriber = self._idle_transcribers.get()
+        try:
+            for seg_dir in renderer.segment_dirs:
+                renderer.transcripts[seg_dir] = renderer.transcribe_segment(seg_dir, callback=self._log_for(job))
+        except Exception as e:
+            self._set_state(job, 'failed', error=str(e))
+            return False
+        finally:
+            self._idle_transcribers.put(renderer.transcriber)
+        return True
+
+    def _encode(self, job):
+        self._set_state(job, 'rendering')
+        started = time.time()
+        try:
+            ok = job['renderer'].generate_script(job['output'], duration_limit=self.duration_limit, callback=self._log_for(job),
+                                                 use_hevc=self.settings.get("use_hevc", False))
+        except Exception as e:
+            self._set_state(job, 'failed', error=str(e))
+            return False
+        if ok: self._set_state(job, 'done', output=job['output'], outputs=job['renderer'].output_paths(job['output']), seconds=round(time.time() - started, 2))
+        else: self._set_state(job, 'failed', error="render failed")
+        return ok
+
+    def run(self):
+        pending = [j for j in self.jobs if j['state'] == 'queued']
+        for job in pending:
+            try: self._prepare(job)
+            except Exception as e: self._set_state(job, 'failed', error=str(e))
+        pending = [j for j in pending if j['state'] == 'queued']
+        if not pending: return []
+        slots = self._encode_slots(pending[0]['renderer'].has_nvenc)
+        for job in pending: self._share_budget(job['renderer'], slots)
+
+        # Encode pool shuts down after the whisper pool, so every chained encode is still accepted
+        with ThreadPoolExecutor(max_workers=slots) as encode_pool:
+            with ThreadPoolExecutor(max_workers=self.whisper_workers) as whisper_pool:
+                def transcribe_then_encode(job):
+                    if self._transcribe(job): encode_pool.submit(self._encode, job)
+                for job in pending:
+                    if job['renderer'].enable_caption: whisper_pool.submit(transcribe_then_encode, job)
+                    else: encode_pool.submit(self._encode, job)
+        if self._owns_transcribers:
+            for w in self.transcribers: w.stop()
+        if self.traces:
+            record = {'time': time.time(), 'event': 'trace_summary', 'jobs': len(self.traces),
+                      'wall_s': round(sum(r['wall_s'] for r in self.traces), 3), 'stages': render_trace.totals(self.traces)}
+            with self._lock: self.status(json.dumps(record))
+        return [j for j in pending if j['state'] == 'done']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render many Cap.so project folders headlessly")
+    parser.add_argument("projects", nargs="+", help="project folders, or folders containing projects")
+    parser.add_argument("--settings", default="settings.conf", help="settings file as saved by the GUI")
+    parser.add_argument("--out-dir", default="renders", help="each job gets its own work directory in here")
+    parser.add_argument("--jobs", type=int, default=None, help="max concurrent ffmpeg encodes (default: by core count)")
+    parser.add_argument("--whisper-workers", type=int, default=1)
+    parser.add_argument("--nvenc-sessions", type=int, default=NVENC_SESSIONS)
+    parser.add_argument("--status-file", default=None, help="also append JSON-lines status here")
+    parser.add_argument("--test", type=float, default=None, metavar="SECONDS", help="render only the first SECONDS")
+    args = parser.parse_args(argv)
+
+    status_file = open(args.status_file, 'a', encoding="utf-8") if args.status_file else None
+    def status(line):
+        print(line, flush=True)
+        if status_file: status_file.write(line + "\n"); status_file.flush()
+
+    batch = BatchQueue(load_settings(args.settings), args.out_dir, args.jobs, args.whisper_workers,
+                       args.nvenc_sessions, status, args.test)
+    for p in args.projects:
+        for project in find_projects(p): batch.add(project)
+    done = batch.run()
+    if status_file: status_file.close()
+    return 0 if len(done) == len(batch.jobs) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
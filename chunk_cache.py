@@ -0,0 +1,98 @@
+# Content-addressed cache of encoded video chunks for incremental re-renders. A chunk's key
+# covers everything its ffmpeg run consumes (source packets in the window, filter script,
+# cursor track, captions, encoder args), so unchanged time ranges are reused as they are.
+# Chunks are written under a temporary name and renamed when complete, which also makes an
+# interrupted render resume from the chunks it already finished.
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import render_cache
+
+# Bump when the chunk layout or graph semantics change in a way the key doesn't capture
+FORMAT = 1
+
+class ChunkCache:
+    def __init__(self, directory=None, max_bytes=20 * 1024 ** 3):
+        self.directory = directory or render_cache.cache_dir("chunks")
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(self.directory, "sources.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self._index_path, 'r', encoding="utf-8") as f: self._sources = json.load(f)
+        except (OSError, ValueError):
+            self._sources = {}
+
+    def source_digest(self, path, start, end):
+        # Hash of the packet bytes ffmpeg reads for [start, end) of the first stream (from the
+        # keyframe before start); remembered per file version so each range is hashed once
+        st = os.stat(path)
+        memo = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{start:.3f}|{end:.3f}"
+        with self._lock:
+            if memo in self._sources: return self._sources[memo]
+        digest = _packet_range_digest(path, start, end) or render_cache.text_digest(memo)
+        with self._lock: self._sources[memo] = digest
+        return digest
+
+    def save_index(self):
+        with self._lock:
+            tmp = self._index_path + ".tmp"
+            with open(tmp, 'w', encoding="utf-8") as f: json.dump(self._sources, f)
+            os.replace(tmp, self._index_path)
+
+    def key(self, *parts): return render_cache.text_digest(FORMAT, *parts)
+
+    def path(self, key): return os.path.join(self.directory, key + ".mp4")
+
+    def partial(self, key): return os.path.join(self.directory, key + ".part.mp4")
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path): return None
+        render_cache.touch(path)
+        return path
+
+    def commit(self, key):
+        os.replace(self.partial(key), self.path(key))
+        return self.path(key)
+
+    def prune(self):
+        # sources.json is rewritten on every render, so it is never the LRU victim; its entries
+        # for recordings that were deleted or changed since can never hit again and are dropped
+        with self._lock:
+            current = {}
+            for memo in list(self._sources):
+                path, size, mtime, _, _ = memo.rsplit("|", 4)
+                if path not in current:
+                    try: st = os.stat(path)
+                    except OSError: st = None
+                    current[path] = st and f"{st.st_size}|{st.st_mtime_ns}"
+                if current[path] != f"{size}|{mtime}": del self._sources[memo]
+        self.save_index()
+        return render_cache.prune(self.directory, self.max_bytes)
+
+def _packet_range_digest(path, start, end):
+    try:
+        res = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', '0', '-read_intervals', f"{start:.3f}%{end:.3f}",
+                              '-show_entries', 'packet=pos,size', '-of', 'compact=p=0', path], capture_output=True, text=True)
+    except OSError:
+        return None
+    lo, hi = None, None
+    for line in res.stdout.splitlines():
+        fields = dict(item.partition("=")[::2] for item in line.strip().split("|"))
+        if not fields.get('pos', "").isdigit() or not fields.get('size', "").isdigit(): continue
+        pos, size = int(fields['pos']), int(fields['size'])
+        lo = pos if lo is None else min(lo, pos)
+        hi = pos + size if hi is None else max(hi, pos + size)
+    if res.returncode != 0 or lo is None: return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(lo)
+        remaining = hi - lo
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk: break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
@@ -0,0 +1,149 @@
+# Cursor data ingest: streams cursor.json into typed arrays and keeps a memory-mappable
+# sidecar (cursor.bin) next to it, so later renders skip JSON parsing entirely.
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+SIDECAR_NAME = "cursor.bin"
+_MAGIC = b"CAPC"
+_VERSION = 1
+# magic, version, source mtime_ns, source size, move count, click count
+_HEADER = struct.Struct("<4sIqqII")
+
+class CursorData:
+    # times/click_times are float64 seconds, xs/ys float32 normalized (0..1),
+    # ids/click_down uint8. Arrays or memoryviews; both are indexable and bisectable.
+    def __init__(self, times, xs, ys, ids, click_times, click_down, mapping=None):
+        self.times, self.xs, self.ys, self.ids = times, xs, ys, ids
+        self.click_times, self.click_down = click_times, click_down
+        self._mapping = mapping
+
+    def __len__(self): return len(self.times)
+
+class _ArrayStream:
+    # Incremental parser for {"key": [ {...}, ... ], ...}; yields the elements of the wanted
+    # top-level arrays one at a time without materialising the whole document.
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f, self.chunk_size = f, chunk_size
+        self.buf, self.pos, self.eof = "", 0, False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data: self.eof = True; return False
+        if self.pos > self.chunk_size:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        self.buf += data
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos < len(self.buf): return self.buf[self.pos]
+            if not self._fill(): return ""
+
+    def _expect(self, ch):
+        if self._peek() != ch: raise ValueError(f"cursor.json: expected '{ch}' at offset {self.pos}")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer end may be a truncated number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self._fill()
+
+    def items(self, keys):
+        self._expect("{")
+        while self._peek() != "}":
+            if not self._peek(): raise ValueError("cursor.json: unexpected end of file")
+            key = self._value()
+            self._expect(":")
+            if key in keys and self._peek() == "[":
+                self.pos += 1
+                while self._peek() != "]":
+                    if not self._peek(): raise ValueError("cursor.json: unexpected end of file")
+                    yield key, self._value()
+                self.pos += 1
+            else:
+                self._value()
+
+def parse_cursor_json(path):
+    times, xs, ys, ids = array('d'), array('f'), array('f'), array('B')
+    c_times, c_down = array('d'), array('B')
+    with open(path, 'r', encoding="utf-8") as f:
+        for key, item in _ArrayStream(f).items(("moves", "clicks")):
+            if key == "moves":
+                times.append(item['time_ms'] / 1000.0); xs.append(item['x']); ys.append(item['y'])
+                ids.append(int(item['cursor_id']))
+            else:
+                c_times.append(item['time_ms'] / 1000.0); c_down.append(1 if item['down'] else 0)
+    return CursorData(*_sorted(times, xs, ys, ids), *_sorted(c_times, c_down))
+
+def _sorted(times, *cols):
+    if all(times[i] <= times[i + 1] for i in range(len(times) - 1)): return (times, *cols)
+    order = sorted(range(len(times)), key=times.__getitem__)
+    return tuple(array(a.typecode, (a[i] for i in order)) for a in (times, *cols))
+
+def write_sidecar(path, st, data):
+    n, c = len(data.times), len(data.click_times)
+    # Renders of the same project can write the sidecar at once; each uses its own temp file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, st.st_mtime_ns, st.st_size, n, c))
+            # float64 first so every section stays aligned for memoryview.cast
+            for a in (data.times, data.click_times, data.xs, data.ys, data.ids, data.click_down):
+                f.write(a.tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+def read_sidecar(path, st):
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER.size)
+        if len(head) < _HEADER.size: return None
+        magic, version, mtime_ns, size, n, c = _HEADER.unpack(head)
+        if (magic, version, mtime_ns, size) != (_MAGIC, _VERSION, st.st_mtime_ns, st.st_size): return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) != _HEADER.size + 8 * (n + c) + 4 * 2 * n + n + c:
+        mm.close()
+        return None
+    mv = memoryview(mm)
+    cols, off = [], _HEADER.size
+    for code, size, count in (('d', 8, n), ('d', 8, c), ('f', 4, n), ('f', 4, n), ('B', 1, n), ('B', 1, c)):
+        cols.append(mv[off:off + size * count].cast(code))
+        off += size * count
+    times, c_times, xs, ys, ids, c_down = cols
+    return CursorData(times, xs, ys, ids, c_times, c_down, mapping=mm)
+
+def load_cursor_data(json_path, log=print):
+    st = os.stat(json_path)
+    sidecar = os.path.join(os.path.dirname(json_path), SIDECAR_NAME)
+    # The sidecar is raw native arrays; only trusted on little-endian hosts
+    if sys.byteorder == "little" and os.path.exists(sidecar):
+        try:
+            data = read_sidecar(sidecar, st)
+            if data is not None:
+                log(f"Loaded cursor sidecar ({len(data)} moves, {len(data.click_times)} clicks)")
+                return data
+        except (OSError, ValueError) as e:
+            log(f"[WARN] Ignoring cursor sidecar: {e}")
+    data = parse_cursor_json(json_path)
+    log(f"Parsed cursor.json ({len(data)} moves, {len(data.click_times)} clicks)")
+    if sys.byteorder == "little":
+        try: write_sidecar(sidecar, st, data)
+        except OSError as e: log(f"[WARN] Could not write cursor sidecar: {e}")
+    return data
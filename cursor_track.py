@@ -0,0 +1,153 @@
+# Per-frame cursor track: resamples cursor moves/clicks to the output frame rate once
+# and drives the overlay/crop filters through a sendcmd file, so the filter graph
+# stays the same size no matter how many cursor events the recording has.
+import bisect
+
+class CursorTrack:
+    # Simplified cursor path in output pixels plus the cursor id and click (pressed 0/1) runs
+    # (value i applies from starts[i] until the next start).
+    def __init__(self, times, xs, ys, id_starts, id_vals, c_starts, c_vals):
+        self.times, self.xs, self.ys = times, xs, ys
+        self.id_starts, self.id_vals = id_starts, id_vals
+        self.c_starts, self.c_vals = c_starts, c_vals
+
+    def window(self, start, end):
+        # Track for [start, end) rebased so `start` becomes t=0. One move on either side is
+        # kept so interpolation at the window edges matches the full track.
+        lo = max(bisect.bisect_right(self.times, start) - 1, 0)
+        hi = min(bisect.bisect_left(self.times, end) + 1, len(self.times))
+        times = [t - start for t in self.times[lo:hi]]
+        return CursorTrack(times, self.xs[lo:hi], self.ys[lo:hi],
+                           *_window_runs(self.id_starts, self.id_vals, start, end),
+                           *_window_runs(self.c_starts, self.c_vals, start, end))
+
+def _window_runs(starts, vals, start, end):
+    lo = max(bisect.bisect_right(starts, start) - 1, 0)
+    hi = max(bisect.bisect_left(starts, end), lo + 1)
+    return [max(t - start, 0.0) for t in starts[lo:hi]], vals[lo:hi]
+
+def _linear(times, values, fps, n_frames):
+    # Single sweep over frames and events, clamped at both ends
+    n = len(times)
+    j = 0
+    for k in range(n_frames):
+        t = k / fps
+        while j < n - 2 and times[j + 1] <= t: j += 1
+        if n == 1 or t <= times[0]: yield values[0]; continue
+        if t >= times[-1]: yield values[-1]; continue
+        t1, t2 = times[j], times[j + 1]
+        if t2 == t1: yield values[j + 1]; continue
+        yield values[j] + (values[j + 1] - values[j]) * (t - t1) / (t2 - t1)
+
+def _step(times, values, fps, n_frames):
+    # Value of the latest event at or before each frame time
+    n = len(times)
+    j = 0
+    for k in range(n_frames):
+        t = k / fps
+        while j < n - 1 and times[j + 1] <= t: j += 1
+        yield values[j]
+
+def write_sendcmd_track(path, fps, duration, times, xs, ys, id_times, ids, c_times, c_pressed, c_size, n_ids=11):
+    # Atlas rows: cursor id i at i*c_size, its pressed variant at (i + n_ids)*c_size
+    n_frames = int(duration * fps) + 1
+    frames = zip(_linear(times, xs, fps, n_frames), _linear(times, ys, fps, n_frames),
+                 _step(id_times, ids, fps, n_frames), _step(c_times, c_pressed, fps, n_frames))
+    last = (None, None, None)
+    count = 0
+    with open(path, 'w', encoding="utf-8") as f:
+        for k, (x, y, cid, pressed) in enumerate(frames):
+            x, y, cy = round(x), round(y), (int(cid) + (n_ids if pressed else 0)) * c_size
+            cmds = []
+            if x != last[0]: cmds.append(f"overlay@cursor x {x}")
+            if y != last[1]: cmds.append(f"overlay@cursor y {y}")
+            if cy != last[2]: cmds.append(f"crop@atlas y {cy}")
+            if cmds:
+                f.write(f"{k / fps:.4f} {','.join(cmds)};\n")
+                count += 1
+            last = (x, y, cy)
+    return count
+
+def smooth_path(times, values, duration, step=0.5, window=2.0, rate=10):
+    # Slow follow path (e.g. for a moving crop): values resampled at `rate` Hz, averaged over
+    # `window` seconds, one point every `step` seconds
+    n = int(duration * rate) + 1
+    sums = [0.0]
+    for v in _linear(times, values, rate, n): sums.append(sums[-1] + v)
+    half = max(1, int(window * rate / 2))
+    stride = max(1, int(step * rate))
+    out_t, out_v = [], []
+    for k in [*range(0, n, stride), *([n - 1] if (n - 1) % stride else [])]:
+        lo, hi = max(0, k - half), min(n, k + half + 1)
+        out_t.append(k / rate)
+        out_v.append((sums[hi] - sums[lo]) / (hi - lo))
+    return out_t, out_v
+
+# --- Path simplification ---
+# Cap.so records thousands of duplicate or collinear moves; every one of them used to become
+# a node in the expression tree (or a line in the track). Dropping them before building keeps
+# the output the same to within tolerance_px at the output resolution.
+
+def merge_runs(times, values):
+    # (times, values) -> (starts, vals) with one entry per run of identical values.
+    # Samples sharing a timestamp collapse to the last one.
+    starts, vals = [], []
+    for t, v in zip(times, values):
+        if starts and t == starts[-1]:
+            starts.pop(); vals.pop()
+        if vals and vals[-1] == v: continue
+        starts.append(t); vals.append(v)
+    return starts, vals
+
+def _rdp_keep(times, xs, ys, tolerance):
+    # Iterative Ramer-Douglas-Peucker using the distance to the time-interpolated position,
+    # since the renderer interpolates by time rather than along the polyline.
+    n = len(times)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    tol2 = tolerance * tolerance
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2: continue
+        ta, xa, ya = times[a], xs[a], ys[a]
+        span = times[b] - ta
+        dx, dy = xs[b] - xa, ys[b] - ya
+        worst, worst_d = -1, tol2
+        for i in range(a + 1, b):
+            f = (times[i] - ta) / span
+            ex, ey = xs[i] - (xa + dx * f), ys[i] - (ya + dy * f)
+            d = ex * ex + ey * ey
+            if d > worst_d: worst, worst_d = i, d
+        if worst >= 0:
+            keep[worst] = True
+            stack.append((a, worst)); stack.append((worst, b))
+    return keep
+
+def simplify_cursor(times, xs, ys, ids, tolerance_px=0.5):
+    # xs/ys may be one-shot iterables; they are read once.
+    # Returns (times, xs, ys, id_starts, id_vals); cursor shape changes are kept as runs
+    # so the ID tree only branches where the shape actually changes.
+    id_starts, id_vals = merge_runs(times, ids)
+
+    # 1. Duplicate timestamps: the last sample wins
+    t1, x1, y1 = [], [], []
+    for t, x, y in zip(times, xs, ys):
+        if t1 and t == t1[-1]:
+            x1[-1], y1[-1] = x, y
+            continue
+        t1.append(t); x1.append(x); y1.append(y)
+
+    # 2. No visible change: inside a run of samples on the same output pixel only the ends matter
+    n = len(t1)
+    px = [(round(x), round(y)) for x, y in zip(x1, y1)]
+    idx = [i for i in range(n) if i == 0 or i == n - 1 or px[i] != px[i - 1] or px[i] != px[i + 1]]
+    t2, x2, y2 = [t1[i] for i in idx], [x1[i] for i in idx], [y1[i] for i in idx]
+
+    # 3. Tolerance-bounded polyline simplification
+    if tolerance_px > 0 and len(t2) > 2:
+        keep = _rdp_keep(t2, x2, y2, tolerance_px)
+        t2 = [v for v, k in zip(t2, keep) if k]
+        x2 = [v for v, k in zip(x2, keep) if k]
+        y2 = [v for v, k in zip(y2, keep) if k]
+    return t2, x2, y2, id_starts, id_vals
@@ -0,0 +1,162 @@
+# Encoder auto-tuner: encodes a few short lossless samples of the composited project with
+# candidate preset/CRF/tune/thread settings, measures speed, size and SSIM/PSNR against the
+# sample, and keeps the fastest candidate that meets the quality floor. Screen recordings
+# and camera-heavy footage compress very differently, so the result is cached per machine,
+# ffmpeg build, encoder, content type and floor.
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import render_cache
+from probe import ffmpeg_version
+
+# Bump when candidates or measurements change in a way that makes old profiles misleading
+FORMAT = 1
+
+# Quality ladders run from the cheapest setting to the best, so each (preset, tune) stops at
+# the first rung that meets the floor
+X264 = {'presets': ("ultrafast", "superfast", "veryfast", "faster", "fast"), 'crf': (28, 26, 23, 20), 'tunes': (None, "stillimage")}
+X265 = {'presets': ("ultrafast", "superfast", "veryfast", "faster"), 'crf': (32, 28, 24, 20), 'tunes': (None,)}
+NVENC = {'presets': ("p1", "p2", "p4", "p6"), 'cq': (30, 26, 23, 20)}
+
+def candidate_ladders(encoder):
+    # [[args, ...], ...]: one ladder per preset/tune, arguments after '-c:v <encoder>'
+    if "nvenc" in encoder:
+        return [[['-preset', p, '-cq', str(q)] for q in NVENC['cq']] for p in NVENC['presets']]
+    grid = X265 if encoder == "libx265" else X264
+    return [[['-preset', p, '-crf', str(c), *(['-tune', t] if t else [])] for c in grid['crf']]
+            for p in grid['presets'] for t in grid['tunes']]
+
+def sample_info(path):
+    # (width, height, frames) of a sample
+    res = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+                          '-show_entries', 'stream=width,height,nb_read_packets', '-of', 'compact=p=0', path],
+                         capture_output=True, text=True)
+    fields = dict(item.partition("=")[::2] for item in res.stdout.strip().split("|"))
+    try: return int(fields['width']), int(fields['height']), int(fields['nb_read_packets'])
+    except (KeyError, ValueError): raise RuntimeError(f"could not probe {path}: {res.stderr.strip()}")
+
+def content_type(samples, infos):
+    # Bits per pixel of the lossless samples: static screen content is far below camera-like motion
+    bits = sum(os.path.getsize(s) * 8 for s in samples)
+    pixels = sum(w * h * n for w, h, n in infos) or 1
+    bpp = bits / pixels
+    kind = "static" if bpp < 1.0 else "mixed" if bpp < 3.0 else "motion"
+    height = max(h for _, h, _ in infos)
+    return f"{kind}-{height}p", bpp
+
+def machine_key():
+    return render_cache.text_digest(platform.machine(), platform.processor(), platform.system(), os.cpu_count(), ffmpeg_version())
+
+def quality(encoded, reference):
+    # (SSIM, PSNR dB) of encoded against reference over all frames
+    graph = "[0:v]split=2 [a][b]; [1:v]split=2 [c][d]; [a][c] ssim [s]; [b][d] psnr [p]"
+    res = subprocess.run(['ffmpeg', '-hide_banner', '-nostats', '-i', encoded, '-i', reference, '-filter_complex', graph,
+                          '-map', '[s]', '-map', '[p]', '-f', 'null', '-'], capture_output=True, text=True, errors="replace")
+    ssim = re.search(r"SSIM .*All:([\d.]+)", res.stderr)
+    psnr = re.search(r"PSNR .*average:([\d.]+|inf)", res.stderr)
+    if res.returncode != 0 or not ssim: raise RuntimeError(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else "quality check failed")
+    return float(ssim.group(1)), float(psnr.group(1)) if psnr else None
+
+def measure(encoder, args, samples, infos):
+    # Encode every sample with these settings; fps over all samples, worst-sample SSIM
+    seconds, size, ssims, psnrs = 0.0, 0, [], []
+    for sample in samples:
+        out = os.path.splitext(sample)[0] + ".tune.mp4"
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-i', sample, '-an', '-c:v', encoder, *args, '-pix_fmt', 'yuv420p', out]
+        started = time.perf_counter()
+        res = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+        seconds += time.perf_counter() - started
+        if res.returncode != 0: return None
+        size += os.path.getsize(out)
+        ssim, psnr = quality(out, sample)
+        ssims.append(ssim)
+        if psnr is not None: psnrs.append(psnr)
+        os.remove(out)
+    frames = sum(n for _, _, n in infos)
+    return {'args': args, 'fps': round(frames / seconds, 1) if seconds else None, 'bytes': size, 'ssim': round(min(ssims), 5),
+            'psnr': round(sum(psnrs) / len(psnrs), 2) if psnrs else None}
+
+def _cache_path(key): return os.path.join(render_cache.cache_dir("tune"), key + ".json")
+
+def tune(encoder, samples, min_ssim=0.97, log=print, refresh=False):
+    # -> profile dict ('args' are the codec arguments to use), or None if no candidate encodes
+    infos = [sample_info(s) for s in samples]
+    kind, bpp = content_type(samples, infos)
+    key = render_cache.text_digest(FORMAT, machine_key(), encoder, kind, min_ssim)
+    path = _cache_path(key)
+    if not refresh:
+        try:
+            with open(path, 'r', encoding="utf-8") as f: profile = json.load(f)
+            render_cache.touch(path)
+            log(f"[Tune] Cached profile for {encoder} ({kind}): {' '.join(profile['args'])}")
+            return profile
+        except (OSError, ValueError):
+            pass
+
+    log(f"[Tune] Benchmarking {encoder} on {len(samples)} samples ({kind}, {bpp:.2f} bpp lossless), SSIM floor {min_ssim}")
+    results = []
+    for ladder in candidate_ladders(encoder):
+        for args in ladder:
+            r = measure(encoder, args, samples, infos)
+            if r is None: break
+            log(f"[Tune]   {' '.join(args):42s} {r['fps']:7.1f} fps  {r['bytes'] / 1024:8.0f} KB  SSIM {r['ssim']:.4f}  PSNR {r['psnr']}")
+            results.append(r)
+            if r['ssim'] >= min_ssim: break
+    if not results: return None
+    passing = [r for r in results if r['ssim'] >= min_ssim]
+    if not passing: log(f"[WARN] No candidate reached SSIM {min_ssim}; using the best one")
+    best = max(passing, key=lambda r: (r['fps'], -r['bytes'])) if passing else max(results, key=lambda r: r['ssim'])
+
+    # Thread count only matters for the software encoders
+    if "nvenc" not in encoder:
+        for threads in sorted({max(1, (os.cpu_count() or 2) // 2), max(1, (os.cpu_count() or 2) // 4)}):
+            r = measure(encoder, [*best['args'], '-threads', str(threads)], samples, infos)
+            if r and r['fps'] > best['fps'] and r['ssim'] >= min(min_ssim, best['ssim']): best = r
+
+    profile = {**best, 'encoder': encoder, 'content': kind, 'min_ssim': min_ssim, 'created': time.time()}
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding="utf-8") as f: json.dump(profile, f, indent=2)
+    os.replace(tmp, path)
+    log(f"[Tune] Chose {' '.join(best['args'])} ({best['fps']} fps, SSIM {best['ssim']})")
+    return profile
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, clear or run the encoder auto-tuner")
+    sub = parser.add_subparsers(dest="action", required=True)
+    sub.add_parser("list")
+    sub.add_parser("clear")
+    p = sub.add_parser("run", help="tune an encoder on samples of a project")
+    p.add_argument("project")
+    p.add_argument("--encoder", default=None, help="default: the encoder a render would pick")
+    p.add_argument("--hevc", action="store_true")
+    p.add_argument("--min-ssim", type=float, default=0.97)
+    p.add_argument("--refresh", action="store_true", help="ignore the cached profile")
+    args = parser.parse_args(argv)
+
+    directory = render_cache.cache_dir("tune")
+    if args.action == "clear":
+        print(f"Removed {render_cache.clear(directory)} cached profiles from {directory}")
+        return 0
+    if args.action == "list":
+        for path, _, last_used in render_cache.entries(directory):
+            try:
+                with open(path, 'r', encoding="utf-8") as f: p = json.load(f)
+            except (OSError, ValueError):
+                continue
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+            print(f"{used}  {p['encoder']:11s} {p['content']:14s} SSIM>={p['min_ssim']}  {' '.join(p['args']):42s} {p['fps']} fps")
+        return 0
+
+    from video_engine import VideoRenderer
+    renderer = VideoRenderer(args.project)
+    renderer.tune_min_ssim = args.min_ssim
+    profile = renderer.tune_encoder(args.encoder or renderer._pick_codec(args.hevc), refresh=args.refresh)
+    return 0 if profile else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
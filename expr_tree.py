@@ -0,0 +1,65 @@
+# Balanced if(lt(t,..)) expression trees, written iteratively straight into a file handle.
+# Uses an explicit stack instead of recursion, so there is no recursion-limit hack, no
+# intermediate strings per subtree, and memory stays bounded by the tree depth.
+import io
+
+_FLUSH_AT = 1 << 16
+
+def _fmt2(v): return f"{v:.2f}"
+
+class _Writer:
+    # Batches the many tiny writes into larger ones
+    def __init__(self, out):
+        self.out, self.parts, self.size = out, [], 0
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= _FLUSH_AT: self.flush()
+
+    def flush(self):
+        if self.parts: self.out.write("".join(self.parts))
+        self.parts, self.size = [], 0
+
+# Linear interpolation between (times[i], values[i]) samples
+def write_lerp_tree(out, times, values, start, end):
+    w = _Writer(out)
+    stack = [(start, end)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str: w.write(item); continue
+        s, e = item
+        if e - s <= 1:
+            t1, t2 = times[s], times[e]
+            v1, v2 = values[s], values[e]
+            if t2 == t1: w.write(f"{v1:.2f}")
+            else: w.write(f"({v1:.2f}+{(v2 - v1) / (t2 - t1):.4f}*(t-{t1:.4f}))")
+            continue
+        m = (s + e) // 2
+        w.write(f"if(lt(t,{times[m]:.4f}),")
+        stack.extend((")", (m, e), ",", (s, m)))
+    w.flush()
+
+# Step function: values[i] for times[i-1] <= t < times[i]; leaves formatted with `fmt`
+def write_step_tree(out, times, values, start, end, fmt=_fmt2):
+    w = _Writer(out)
+    stack = [(start, end)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str: w.write(item); continue
+        s, e = item
+        if s == e: w.write(fmt(values[s])); continue
+        m = (s + e) // 2
+        w.write(f"if(lt(t,{times[m]:.4f}),")
+        stack.extend((")", (m + 1, e), ",", (s, m)))
+    w.flush()
+
+def lerp_tree(times, values, start, end):
+    buf = io.StringIO()
+    write_lerp_tree(buf, times, values, start, end)
+    return buf.getvalue()
+
+def step_tree(times, values, start, end, fmt=_fmt2):
+    buf = io.StringIO()
+    write_step_tree(buf, times, values, start, end, fmt)
+    return buf.getvalue()
@@ -0,0 +1,124 @@
+# ffmpeg progress reporting: runs ffmpeg with `-progress pipe:1`, turns the key=value blocks
+# into Progress events (throttled), and keeps only the last lines of stderr for error reports.
+import collections
+import re
+import subprocess
+import threading
+import time
+
+class Progress:
+    def __init__(self, frame=0, fps=0.0, speed=None, out_time=0.0, bitrate=None, total=None, elapsed=0.0, done=False):
+        self.frame, self.fps, self.speed, self.out_time = frame, fps, speed, out_time
+        self.bitrate, self.total, self.elapsed, self.done = bitrate, total, elapsed, done
+
+    @property
+    def percent(self):
+        if not self.total: return None
+        return 100.0 if self.done else min(100.0, 100.0 * self.out_time / self.total)
+
+    @property
+    def eta(self):
+        # Seconds left at the current speed (media seconds per wall second)
+        if self.done: return 0.0
+        speed = self.speed or (self.out_time / self.elapsed if self.elapsed > 0 else None)
+        if not self.total or not speed: return None
+        return max(0.0, (self.total - self.out_time) / speed)
+
+    def as_dict(self):
+        return {'frame': self.frame, 'fps': self.fps, 'speed': self.speed, 'out_time': round(self.out_time, 3),
+                'bitrate': self.bitrate, 'total': self.total, 'percent': self.percent, 'eta': self.eta, 'done': self.done}
+
+    def __str__(self):
+        parts = [f"frame={self.frame}", f"fps={self.fps:.1f}", f"time={format_seconds(self.out_time)}"]
+        if self.speed: parts.append(f"speed={self.speed:.2f}x")
+        if self.bitrate: parts.append(f"bitrate={self.bitrate:.0f}kbit/s")
+        if self.percent is not None: parts.append(f"{self.percent:.1f}%")
+        if self.eta is not None: parts.append(f"ETA {format_seconds(self.eta)}")
+        return " ".join(parts)
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def _number(value, suffix=""):
+    value = value.strip()
+    if suffix and value.endswith(suffix): value = value[:-len(suffix)]
+    try: return float(value)
+    except ValueError: return None
+
+def _event(block, total, elapsed):
+    # out_time_ms is in microseconds too (long-standing ffmpeg quirk); prefer out_time_us
+    us = _number(block.get('out_time_us') or block.get('out_time_ms') or "0")
+    return Progress(frame=int(_number(block.get('frame', "0")) or 0), fps=_number(block.get('fps', "0")) or 0.0,
+                    speed=_number(block.get('speed', ""), "x"), out_time=max(0.0, (us or 0) / 1e6),
+                    bitrate=_number(block.get('bitrate', ""), "kbits/s"), total=total, elapsed=elapsed,
+                    done=block.get('progress') == "end")
+
+def run_ffmpeg(cmd, total=None, on_progress=None, interval=0.5, tail=200, stats=None):
+    # -> (returncode, last `tail` stderr lines). on_progress gets at most one event per
+    # `interval` seconds, plus the final one. A stats dict gets the run's timing: wall time, time to
+    # the first frame (opening inputs, filter graph init), frames, and ffmpeg's -benchmark figures
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *(['-benchmark'] if stats is not None else []), *cmd[1:]]
+    started = time.time()
+    first_frame, frames = None, 0
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+    stderr = collections.deque(maxlen=tail)
+    drain = threading.Thread(target=lambda: stderr.extend(process.stderr), daemon=True)
+    drain.start()
+    block, last_emit = {}, 0.0
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        if not key: continue
+        block[key] = value
+        if key != "progress": continue
+        now = time.time()
+        frames = int(_number(block.get('frame', "0")) or 0)
+        if frames and first_frame is None: first_frame = now - started
+        if on_progress and (value == "end" or now - last_emit >= interval):
+            on_progress(_event(block, total, now - started))
+            last_emit = now
+        block = {}
+    process.wait()
+    drain.join()
+    if stats is not None:
+        stats.update(started=started, wall_s=round(time.time() - started, 3), first_frame_s=first_frame and round(first_frame, 3),
+                     frames=frames, returncode=process.returncode, **_bench(stderr))
+    return process.returncode, list(stderr)
+
+def _bench(lines):
+    # -benchmark lines: user/system CPU and real time of the run, peak RSS
+    out = {}
+    for line in lines:
+        m = re.search(r"utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s", line)
+        if m: out.update(utime_s=float(m.group(1)), stime_s=float(m.group(2)), rtime_s=float(m.group(3)))
+        m = re.search(r"maxrss=(\d+)\s*(?:KiB|kB)", line)
+        if m: out['maxrss_mb'] = round(int(m.group(1)) / 1024, 1)
+    return out
+
+class ProgressTracker:
+    # Combines progress from parallel ffmpeg runs (chunks, segments) into one event stream
+    def __init__(self, total, emit, interval=0.5):
+        self.total, self.emit, self.interval = total, emit, interval
+        self.parts = {}
+        self.started = time.time()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, key, progress):
+        with self._lock:
+            self.parts[key] = progress
+            now = time.time()
+            if now - self._last < self.interval: return
+            self._last = now
+            parts = list(self.parts.values())
+        elapsed = now - self.started
+        out_time = sum(p.out_time for p in parts)
+        self.emit(Progress(frame=sum(p.frame for p in parts), fps=sum(p.fps for p in parts if not p.done),
+                           speed=out_time / elapsed if elapsed > 0 else None, out_time=out_time,
+                           bitrate=None, total=self.total, elapsed=elapsed))
+
+    def finish(self):
+        elapsed = time.time() - self.started
+        out_time = sum(p.out_time for p in self.parts.values())
+        self.emit(Progress(frame=sum(p.frame for p in self.parts.values()), out_time=out_time, total=self.total,
+                           speed=out_time / elapsed if elapsed > 0 else None, elapsed=elapsed, done=True))
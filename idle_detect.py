@@ -0,0 +1,136 @@
+# Dead-span analysis for jump-cuts: a span is dead when the cursor doesn't move or click,
+# nobody speaks (silencedetect on the audio) and the screen doesn't change (freezedetect on
+# the display video). Results are cached by the content of the three inputs plus the
+# detection settings, so re-renders don't rescan the media.
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import render_cache
+from cursor_data import load_cursor_data
+from transcription import speech_spans
+
+# Bump when detection changes
+FORMAT = 1
+
+def cursor_idle_spans(cursor, duration, min_idle=2.0, min_move=0.002):
+    # Gaps of at least min_idle seconds without a visible move (normalized units) or a click
+    events = sorted([*(t for t in cursor.click_times), *_moves(cursor, min_move)])
+    spans, last = [], 0.0
+    for t in [*events, duration]:
+        if t - last >= min_idle: spans.append((last, min(t, duration)))
+        last = max(last, t)
+    return spans
+
+def _moves(cursor, min_move):
+    px = py = None
+    for t, x, y in zip(cursor.times, cursor.xs, cursor.ys):
+        if px is None or abs(x - px) > min_move or abs(y - py) > min_move:
+            px, py = x, y
+            yield t
+
+def silent_spans(audio_path, noise_db=-35, min_silence=2.0):
+    speech, duration = speech_spans(audio_path, noise_db, min_silence)
+    return complement(speech, duration), duration
+
+def static_spans(video_path, noise=0.003, min_still=2.0):
+    # freezedetect on a downscaled decode; an open freeze runs to the end of the file
+    res = subprocess.run(['ffmpeg', '-hide_banner', '-nostats', '-an', '-i', video_path, '-vf',
+                          f'scale=320:-2, freezedetect=n={noise}:d={min_still}', '-f', 'null', '-'],
+                         capture_output=True, text=True, errors="replace")
+    if res.returncode != 0: raise RuntimeError(f"freezedetect failed for {video_path}")
+    m = re.search(r"Duration: (\d+):(\d+):([\d.]+)", res.stderr)
+    duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)) if m else None
+    spans, start = [], None
+    for kind, value in re.findall(r"freeze_(start|end): ([\d.]+)", res.stderr):
+        if kind == "start": start = float(value)
+        elif start is not None: spans.append((start, float(value))); start = None
+    if start is not None and duration: spans.append((start, duration))
+    return spans
+
+def complement(spans, duration):
+    out, pos = [], 0.0
+    for start, end in spans:
+        if start > pos: out.append((pos, start))
+        pos = max(pos, end)
+    if pos < duration: out.append((pos, duration))
+    return out
+
+def intersect(a, b):
+    # Intersection of two sorted span lists
+    out, i, j = [], 0, 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if end > start: out.append((start, end))
+        if a[i][1] < b[j][1]: i += 1
+        else: j += 1
+    return out
+
+def _stamp(path):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+def analyze(segment_dir, min_dead=3.0, padding=0.5, noise_db=-35, freeze_noise=0.003, log=print):
+    # -> {'duration', 'idle', 'silent', 'static', 'dead'}; dead spans already shrunk by padding
+    cursor_json, audio, display = (os.path.join(segment_dir, n) for n in ('cursor.json', 'audio-input.ogg', 'display.mp4'))
+    # The recordings are keyed by path, size and mtime like probe.media_info: hashing a long
+    # display.mp4 would cost about as much as scanning it
+    key = render_cache.text_digest(FORMAT, render_cache.file_digest(cursor_json), _stamp(audio), _stamp(display), min_dead, padding, noise_db, freeze_noise)
+    path = os.path.join(render_cache.cache_dir("analysis"), key + ".json")
+    try:
+        with open(path, 'r', encoding="utf-8") as f: result = json.load(f)
+        render_cache.touch(path)
+        log("[Jump-cut] Using cached analysis")
+        return result
+    except (OSError, ValueError):
+        pass
+
+    # Every detector uses a shorter minimum than min_dead; padding and the intersection trim them
+    min_each = max(0.5, min_dead / 2)
+    log("[Jump-cut] Scanning audio for silence...")
+    silent, duration = silent_spans(audio, noise_db, min_each)
+    log("[Jump-cut] Scanning screen for still frames...")
+    static = static_spans(display, freeze_noise, min_each)
+    idle = cursor_idle_spans(load_cursor_data(cursor_json, lambda msg: None), duration, min_each)
+    dead = []
+    for start, end in intersect(intersect(idle, silent), static):
+        start, end = start + padding, end - padding
+        if end - start >= min_dead: dead.append((start, end))
+    result = {'duration': duration, 'idle': idle, 'silent': silent, 'static': static, 'dead': dead}
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding="utf-8") as f: json.dump(result, f)
+    os.replace(tmp, path)
+    return result
+
+def jump_cut(ranges, dead, speed=None):
+    # Removes dead spans from (start, end, speed) ranges, or plays them at `speed` instead
+    out = []
+    for start, end, sp in ranges:
+        pos = start
+        for d_start, d_end in dead:
+            d_start, d_end = max(d_start, start), min(d_end, end)
+            if d_end <= d_start: continue
+            if d_start > pos: out.append((pos, d_start, sp))
+            if speed: out.append((d_start, d_end, sp * speed))
+            pos = d_end
+        if pos < end: out.append((pos, end, sp))
+    return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find dead spans (no cursor activity, silence, still screen) in a project")
+    parser.add_argument("project")
+    parser.add_argument("--min-dead", type=float, default=3.0)
+    parser.add_argument("--padding", type=float, default=0.5)
+    args = parser.parse_args(argv)
+    from video_engine import discover_segments
+    for seg_dir in discover_segments(args.project):
+        result = analyze(seg_dir, args.min_dead, args.padding)
+        removed = sum(e - s for s, e in result['dead'])
+        print(f"{os.path.basename(seg_dir)}: {len(result['dead'])} dead spans, {removed:.1f}s of {result['duration']:.1f}s")
+        for s, e in result['dead']: print(f"  {s:9.2f} - {e:9.2f}  ({e - s:.1f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,9 @@ import threading
 import datetime
 import json
 from video_engine import VideoRenderer
+from batch_render import BatchQueue, apply_settings, find_projects
+from transcription import TranscriptionWorker
+from ffmpeg_progress import format_seconds
 
 # Setup Theme
 ctk.set_appearance_mode("Dark")
@@ -33,6 +36,19 @@ class RenderApp(ctk.CTk):
         self.enable_caption = tk.BooleanVar(value=False)
         self.use_faster = tk.BooleanVar(value=False)
         self.use_hevc = tk.BooleanVar(value=False)
+        self.cursor_sendcmd = tk.BooleanVar(value=False)
+        self.chunked = tk.BooleanVar(value=False)
+        self.parallel_whisper = tk.BooleanVar(value=False)
+        self.incremental = tk.BooleanVar(value=False)
+        self.keep_ranges = tk.StringVar(value="")
+        self.auto_tune = tk.BooleanVar(value=False)
+        self.music_file = tk.StringVar(value="")
+        self.music_duck = tk.BooleanVar(value=True)
+        self.multi_rendition = tk.BooleanVar(value=False)
+        self.jump_cuts = tk.StringVar(value="Off")
+        self.output_resolution = tk.StringVar(value="Source")
+        self.output_fps = tk.StringVar(value="Source")
+        self.stream_output = tk.BooleanVar(value=False)
         self.whisper_model = tk.StringVar(value="base")
         self.font_name = tk.StringVar(value="Arial")
         self.font_size = tk.IntVar(value=24) # Still safe for Entry if validated
@@ -41,12 +57,14 @@ class RenderApp(ctk.CTk):
         self.load_settings()
         
         self.is_rendering = False
+        # One Whisper worker per session: models load on the first captioned render and stay warm
+        self.transcriber = TranscriptionWorker()
         self._create_widgets()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def _create_widgets(self):
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(5, weight=1)
+        self.grid_rowconfigure(6, weight=1)
 
         # 1. Project Selection
         frame_dir = ctk.CTkFrame(self)
@@ -89,12 +107,17 @@ class RenderApp(ctk.CTk):
         ctk.CTkLabel(frame_ai, text="Model:").grid(row=1, column=2, sticky="e", padx=5)
         ctk.CTkComboBox(frame_ai, variable=self.whisper_model, values=["tiny", "base", "small", "medium"], width=90).grid(row=1, column=3, sticky="w", padx=10)
 
-        # Font Settings
-        system_fonts = sorted(list(font.families()))
+        # Font Settings (the system font list is slow to enumerate; filled on first hover)
         ctk.CTkLabel(frame_ai, text="Font:").grid(row=2, column=0, sticky="w", padx=10)
-        font_cb = ctk.CTkComboBox(frame_ai, variable=self.font_name, values=system_fonts, width=150)
+        font_cb = ctk.CTkComboBox(frame_ai, variable=self.font_name, values=[self.font_name.get() or "Arial"], width=150)
         font_cb.grid(row=2, column=1, sticky="w", padx=10)
-        if "Arial" in system_fonts and not self.font_name.get(): font_cb.set("Arial")
+        if not self.font_name.get(): font_cb.set("Arial")
+        fonts_loaded = []
+        def load_fonts(event=None):
+            if fonts_loaded: return
+            fonts_loaded.append(True)
+            font_cb.configure(values=sorted(font.families()))
+        font_cb.bind("<Enter>", load_fonts, add="+")
         
         ctk.CTkLabel(frame_ai, text="Size:").grid(row=2, column=2, sticky="e", padx=5)
         # For font size, simple entry is enough, we handle validation manually if needed
@@ -102,24 +125,60 @@ class RenderApp(ctk.CTk):
 
         # Caption Position Slider
         self.create_smart_slider(frame_ai, "Bottom Margin:", self.cap_pos_var, 0, 500, 3)
+        ctk.CTkCheckBox(frame_ai, text="Parallel CPU Transcription (split at silences)", variable=self.parallel_whisper).grid(row=4, column=0, columnspan=4, padx=10, pady=5, sticky="w")
 
         # 4. Render Settings
         frame_ren = ctk.CTkFrame(self)
         frame_ren.grid(row=3, column=0, padx=20, pady=10, sticky="ew")
         ctk.CTkLabel(frame_ren, text="Render Options", font=("Roboto", 14, "bold")).pack(anchor="w", padx=10, pady=5)
         ctk.CTkCheckBox(frame_ren, text="Use H.265 (HEVC) - Smaller File Size", variable=self.use_hevc).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="Per-frame Cursor Track (faster for long recordings)", variable=self.cursor_sendcmd).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="Parallel Chunked Render (multi-core)", variable=self.chunked).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="Incremental Re-render (reuse unchanged chunks, resume)", variable=self.incremental).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="Auto-tune Encoder (benchmark on samples, cached)", variable=self.auto_tune).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="1080p + 720p + Vertical 9:16 in one pass (vertical follows cursor)", variable=self.multi_rendition).pack(anchor="w", padx=10, pady=5)
+        ctk.CTkCheckBox(frame_ren, text="Streaming Output (HLS fMP4 segments while rendering)", variable=self.stream_output).pack(anchor="w", padx=10, pady=5)
+        size_row = ctk.CTkFrame(frame_ren, fg_color="transparent")
+        size_row.pack(anchor="w", fill="x", padx=10, pady=5)
+        ctk.CTkLabel(size_row, text="Output:").pack(side="left")
+        ctk.CTkComboBox(size_row, variable=self.output_resolution, values=["Source", "3840x2160", "2560x1440", "1920x1080", "1280x720"], width=130).pack(side="left", padx=10)
+        ctk.CTkLabel(size_row, text="FPS:").pack(side="left", padx=(10,0))
+        ctk.CTkComboBox(size_row, variable=self.output_fps, values=["Source", "24", "30", "60"], width=90).pack(side="left", padx=10)
+        trim_row = ctk.CTkFrame(frame_ren, fg_color="transparent")
+        trim_row.pack(anchor="w", fill="x", padx=10, pady=5)
+        ctk.CTkLabel(trim_row, text="Trim (keep):").pack(side="left")
+        ctk.CTkEntry(trim_row, textvariable=self.keep_ranges, placeholder_text="0:10-1:30, 5:00-", width=260).pack(side="left", padx=10)
+        ctk.CTkLabel(trim_row, text="Dead spans:").pack(side="left", padx=(10,0))
+        ctk.CTkComboBox(trim_row, variable=self.jump_cuts, values=["Off", "Cut", "Speed up"], width=110).pack(side="left", padx=10)
+        music_row = ctk.CTkFrame(frame_ren, fg_color="transparent")
+        music_row.pack(anchor="w", fill="x", padx=10, pady=5)
+        ctk.CTkLabel(music_row, text="Music:").pack(side="left")
+        ctk.CTkEntry(music_row, textvariable=self.music_file, placeholder_text="Background music (optional)", width=260).pack(side="left", padx=10)
+        ctk.CTkButton(music_row, text="Browse", width=70, command=self._browse_music).pack(side="left")
+        ctk.CTkCheckBox(music_row, text="Duck under speech", variable=self.music_duck).pack(side="left", padx=10)
 
         # 5. Buttons
         frame_act = ctk.CTkFrame(self, fg_color="transparent")
         frame_act.grid(row=4, column=0, padx=20, pady=10, sticky="ew")
-        self.btn_test = ctk.CTkButton(frame_act, text="Test Render (1 min)", fg_color="#2b2b2b", border_width=2, command=lambda: self._start_render(60))
+        self.btn_test = ctk.CTkButton(frame_act, text="Preview (sampled, fast)", fg_color="#2b2b2b", border_width=2, command=lambda: self._start_render(preview=True))
         self.btn_test.pack(side="left", fill="x", expand=True, padx=(0,10))
+        self.btn_batch = ctk.CTkButton(frame_act, text="Batch Render...", fg_color="#2b2b2b", border_width=2, command=self._start_batch)
+        self.btn_batch.pack(side="left", fill="x", expand=True, padx=(0,10))
         self.btn_render = ctk.CTkButton(frame_act, text="RENDER FULL VIDEO", font=("Roboto", 16, "bold"), height=40, command=self._start_render)
         self.btn_render.pack(side="right", fill="x", expand=True, padx=(10,0))
 
-        # 6. Log
+        # 6. Progress
+        frame_prog = ctk.CTkFrame(self, fg_color="transparent")
+        frame_prog.grid(row=5, column=0, padx=20, pady=(0,10), sticky="ew")
+        self.progress_bar = ctk.CTkProgressBar(frame_prog)
+        self.progress_bar.pack(side="left", fill="x", expand=True, padx=(0,10))
+        self.progress_bar.set(0)
+        self.progress_label = ctk.CTkLabel(frame_prog, text="Idle", width=260, anchor="e")
+        self.progress_label.pack(side="right")
+
+        # 7. Log
         self.log_area = ctk.CTkTextbox(self, height=150)
-        self.log_area.grid(row=5, column=0, padx=20, pady=(0,20), sticky="nsew")
+        self.log_area.grid(row=6, column=0, padx=20, pady=(0,20), sticky="nsew")
         self.log_area.configure(state="disabled")
 
     def create_smart_slider(self, parent, label_text, variable, from_val, to_val, row_idx):
@@ -179,6 +238,19 @@ class RenderApp(ctk.CTk):
                     self.enable_caption.set(data.get("enable_caption", False))
                     self.use_faster.set(data.get("use_faster", False))
                     self.use_hevc.set(data.get("use_hevc", False))
+                    self.cursor_sendcmd.set(data.get("cursor_sendcmd", False))
+                    self.chunked.set(data.get("chunked", False))
+                    self.parallel_whisper.set(data.get("parallel_whisper", False))
+                    self.incremental.set(data.get("incremental", False))
+                    self.keep_ranges.set(data.get("keep_ranges", ""))
+                    self.auto_tune.set(data.get("auto_tune", False))
+                    self.music_file.set(data.get("music_file", ""))
+                    self.music_duck.set(data.get("music_duck", True))
+                    self.multi_rendition.set(bool(data.get("renditions")))
+                    self.jump_cuts.set({"drop": "Cut", "speed": "Speed up"}.get(data.get("jump_cuts"), "Off"))
+                    self.output_resolution.set(data.get("output_resolution") or "Source")
+                    self.output_fps.set(str(data.get("output_fps") or "Source"))
+                    self.stream_output.set(bool(data.get("stream_output")))
                     self.whisper_model.set(data.get("whisper_model", "base"))
                     self.font_name.set(data.get("font_name", "Arial"))
                     self.font_size.set(data.get("font_size", 24))
@@ -186,8 +258,8 @@ class RenderApp(ctk.CTk):
             except Exception as e:
                 print(f"Error loading config: {e}")
 
-    def save_settings(self):
-        data = {
+    def _settings_dict(self):
+        return {
             "project_dir": self.project_dir.get(),
             "cam_scale": self.cam_scale_var.get(),
             "cursor_scale": self.cursor_scale_var.get(),
@@ -196,11 +268,27 @@ class RenderApp(ctk.CTk):
             "enable_caption": self.enable_caption.get(),
             "use_faster": self.use_faster.get(),
             "use_hevc": self.use_hevc.get(),
+            "cursor_sendcmd": self.cursor_sendcmd.get(),
+            "chunked": self.chunked.get(),
+            "parallel_whisper": self.parallel_whisper.get(),
+            "incremental": self.incremental.get(),
+            "keep_ranges": self.keep_ranges.get(),
+            "auto_tune": self.auto_tune.get(),
+            "music_file": self.music_file.get(),
+            "music_duck": self.music_duck.get(),
+            "renditions": "1080p,720p,vertical" if self.multi_rendition.get() else "",
+            "jump_cuts": {"Cut": "drop", "Speed up": "speed"}.get(self.jump_cuts.get(), ""),
+            "output_resolution": "" if self.output_resolution.get() == "Source" else self.output_resolution.get(),
+            "output_fps": "" if self.output_fps.get() == "Source" else self.output_fps.get(),
+            "stream_output": "fmp4" if self.stream_output.get() else "",
             "whisper_model": self.whisper_model.get(),
             "font_name": self.font_name.get(),
             "font_size": self.font_size.get(),
             "cap_pos": self.cap_pos_var.get()
         }
+
+    def save_settings(self):
+        data = self._settings_dict()
         try:
             with open(CONFIG_FILE, 'w') as f:
                 json.dump(data, f, indent=4)
@@ -209,6 +297,7 @@ class RenderApp(ctk.CTk):
 
     def on_close(self):
         self.save_settings()
+        self.transcriber.stop()
         self.destroy()
 
     def _log(self, msg):
@@ -217,11 +306,22 @@ class RenderApp(ctk.CTk):
         self.log_area.see("end")
         self.log_area.configure(state="disabled")
 
+    def _show_progress(self, p):
+        if p.percent is not None: self.progress_bar.set(p.percent / 100)
+        text = f"{p.percent:.0f}%" if p.percent is not None else format_seconds(p.out_time)
+        if p.speed: text += f"  {p.speed:.2f}x"
+        if p.eta is not None and not p.done: text += f"  ETA {format_seconds(p.eta)}"
+        self.progress_label.configure(text=text)
+
     def _browse_dir(self):
         d = filedialog.askdirectory()
         if d: self.project_dir.set(d)
 
-    def _start_render(self, limit=None):
+    def _browse_music(self):
+        f = filedialog.askopenfilename(filetypes=[("Audio", "*.mp3 *.wav *.ogg *.m4a *.flac *.aac"), ("All files", "*.*")])
+        if f: self.music_file.set(f)
+
+    def _start_render(self, limit=None, preview=False):
         self.save_settings()
         if self.is_rendering: return
         p_dir = self.project_dir.get()
@@ -230,36 +330,30 @@ class RenderApp(ctk.CTk):
             return
 
         self.is_rendering = True
-        self.btn_render.configure(state="disabled"); self.btn_test.configure(state="disabled")
+        self.btn_render.configure(state="disabled"); self.btn_test.configure(state="disabled"); self.btn_batch.configure(state="disabled")
         self.log_area.configure(state="normal"); self.log_area.delete("1.0", "end"); self.log_area.configure(state="disabled")
         self._log("Initializing Engine...")
+        self.progress_bar.set(0); self.progress_label.configure(text="Starting...")
         
-        threading.Thread(target=self._render_task, args=(limit,), daemon=True).start()
+        threading.Thread(target=self._render_task, args=(limit, preview), daemon=True).start()
 
-    def _render_task(self, limit):
+    def _render_task(self, limit, preview=False):
         try:
-            renderer = VideoRenderer(self.project_dir.get())
             # Map vars
-            renderer.cam_scale_w = self.cam_scale_var.get()
-            renderer.cam_scale_h = int(renderer.cam_scale_w * (9/16))
-            renderer.cursor_scale = self.cursor_scale_var.get()
-            renderer.cam_shape = self.cam_shape.get()
-            renderer.cam_position = self.cam_pos.get()
-            renderer.enable_caption = self.enable_caption.get()
-            renderer.whisper_model = self.whisper_model.get()
-            renderer.use_faster_whisper = self.use_faster.get()
-            renderer.caption_font = self.font_name.get()
-            renderer.caption_size = self.font_size.get()
-            renderer.caption_pos = self.cap_pos_var.get()
+            renderer = apply_settings(VideoRenderer(self.project_dir.get()), self._settings_dict())
+            renderer.transcriber = self.transcriber
+            renderer.progress_callback = lambda p: self.after(0, lambda: self._show_progress(p))
             
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            mode = "test" if limit else "full"
+            mode = "preview" if preview else "test" if limit else "full"
             out = f"render_{timestamp}_{mode}.mp4"
             
             def log_callback(msg): self.after(0, lambda: self._log(msg))
-            success = renderer.generate_script(out, duration_limit=limit, callback=log_callback, use_hevc=self.use_hevc.get())
+            if preview: success = renderer.generate_preview(out, callback=log_callback)
+            else: success = renderer.generate_script(out, duration_limit=limit, callback=log_callback, use_hevc=self.use_hevc.get())
             
-            if success: self.after(0, lambda: messagebox.showinfo("Success", f"Render Complete!\nSaved: {out}"))
+            saved = "\n".join([out] if preview else renderer.output_paths(out))
+            if success: self.after(0, lambda: messagebox.showinfo("Success", f"Render Complete!\nSaved: {saved}"))
             else: self.after(0, lambda: messagebox.showerror("Failed", "Render Failed. See Log."))
         except Exception as e:
             err = str(e)
@@ -268,6 +362,54 @@ class RenderApp(ctk.CTk):
             self.is_rendering = False
             self.after(0, lambda: self.btn_render.configure(state="normal"))
             self.after(0, lambda: self.btn_test.configure(state="normal"))
+            self.after(0, lambda: self.btn_batch.configure(state="normal"))
+
+    def _start_batch(self):
+        self.save_settings()
+        if self.is_rendering: return
+        root = filedialog.askdirectory(title="Folder containing projects")
+        if not root: return
+        projects = find_projects(root)
+        if not projects:
+            messagebox.showerror("Error", "No project folders (with segments/) found.")
+            return
+
+        self.is_rendering = True
+        for b in (self.btn_render, self.btn_test, self.btn_batch): b.configure(state="disabled")
+        self.log_area.configure(state="normal"); self.log_area.delete("1.0", "end"); self.log_area.configure(state="disabled")
+        self._log(f"Batch: {len(projects)} projects queued")
+        threading.Thread(target=self._batch_task, args=(projects,), daemon=True).start()
+
+    def _batch_task(self, projects):
+        def status(line):
+            rec = json.loads(line)
+            if rec.get('event') == 'trace_summary':
+                top = ", ".join(f"{k} {t['wall_s']:.1f}s" for k, t in list(rec['stages'].items())[:5])
+                self.after(0, lambda: self._log(f"[Trace] {rec['jobs']} renders, {rec['wall_s']:.1f}s total; {top}"))
+                return
+            # Segment records are for uploaders, and every render logs its own [Trace] line
+            if rec.get('event') in ('segment', 'trace'): return
+            name = os.path.basename(rec['project'])
+            if rec.get('event') == 'progress':
+                pct = f"{rec['percent']:.0f}%" if rec['percent'] is not None else "..."
+                text = f"#{rec['job']} {name}: {pct}" + (f"  {rec['speed']:.2f}x" if rec['speed'] else "")
+                self.after(0, lambda: self.progress_label.configure(text=text))
+                return
+            msg = f"[#{rec['job']} {name}] " + (rec['msg'] if rec.get('event') == 'log' else rec['state'].upper() + (f": {rec['error']}" if 'error' in rec else ""))
+            self.after(0, lambda: self._log(msg))
+        try:
+            queue = BatchQueue(self._settings_dict(), out_dir=os.path.join(os.getcwd(), "renders"), status=status,
+                               transcribers=[self.transcriber])
+            for p in projects: queue.add(p)
+            done = queue.run()
+            summary = f"Batch finished: {len(done)}/{len(projects)} rendered into ./renders"
+            self.after(0, lambda: messagebox.showinfo("Batch", summary))
+        except Exception as e:
+            err = str(e)
+            self.after(0, lambda: self._log(f"[CRITICAL ERROR] {err}"))
+        finally:
+            self.is_rendering = False
+            for b in (self.btn_render, self.btn_test, self.btn_batch): self.after(0, lambda b=b: b.configure(state="normal"))
 
 if __name__ == "__main__":
     app = RenderApp()
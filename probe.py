@@ -0,0 +1,142 @@
+# Machine capability probe. Each candidate encoder does a tiny real test encode (an encoder
+# can be listed by `ffmpeg -encoders` and still fail, e.g. NVENC without a driver); results
+# are cached on disk per ffmpeg build, so this runs once per machine and ffmpeg version.
+# CUDA for Whisper is checked only when captions actually need it (importing torch is slow).
+# Media files are ffprobed once; results are cached per path, size and mtime.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import render_cache
+
+ENCODERS = ("h264_nvenc", "hevc_nvenc", "libx264", "libx265")
+
+_lock = threading.Lock()
+# The encoder probe can take minutes of test encodes; media_info must not wait on it
+_encoders_lock = threading.Lock()
+_encoders = None
+_cuda = None
+_media = {}
+
+def ffmpeg_version():
+    try: return subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError): return None
+
+def _test_encode(encoder):
+    # NVENC rejects tiny frames, so use 256x256
+    cmd = ['ffmpeg', '-hide_banner', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=black:s=256x256:r=10:d=0.5',
+           '-frames:v', '3', '-pix_fmt', 'yuv420p', '-c:v', encoder, '-f', 'null', '-']
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return {'ok': False, 'error': str(e)}
+    if res.returncode == 0: return {'ok': True}
+    lines = res.stderr.strip().splitlines()
+    return {'ok': False, 'error': lines[-1] if lines else f"exit code {res.returncode}"}
+
+def _cache_path(): return os.path.join(render_cache.cache_dir("probe"), "encoders.json")
+
+def encoders(refresh=False):
+    # {encoder: {'ok': bool, 'error': str}}; probed once per ffmpeg version
+    global _encoders
+    with _encoders_lock:
+        if _encoders is not None and not refresh: return _encoders
+        version = ffmpeg_version()
+        path = _cache_path()
+        if not refresh and version:
+            try:
+                with open(path, 'r', encoding="utf-8") as f: cached = json.load(f)
+                if cached.get('ffmpeg') == version and set(ENCODERS) <= set(cached.get('encoders', {})):
+                    _encoders = cached['encoders']
+                    return _encoders
+            except (OSError, ValueError):
+                pass
+        if version is None:
+            # No ffmpeg at all; don't cache, the next run may have it
+            _encoders = {name: {'ok': False, 'error': "ffmpeg not found"} for name in ENCODERS}
+            return _encoders
+        _encoders = {name: _test_encode(name) for name in ENCODERS}
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding="utf-8") as f: json.dump({'ffmpeg': version, 'encoders': _encoders}, f, indent=2)
+        os.replace(tmp, path)
+        return _encoders
+
+def encoder_ok(name): return encoders().get(name, {}).get('ok', False)
+
+def pick_encoder(use_hevc=False):
+    # First working encoder in order of preference, or None
+    order = ("hevc_nvenc", "libx265", "h264_nvenc", "libx264") if use_hevc else ("h264_nvenc", "libx264")
+    return next((name for name in order if encoder_ok(name)), None)
+
+def cpu_encoder(encoder):
+    # CPU encoder to redo a failed `encoder` run with: same format where it works, else H.264
+    if encoder in ("hevc_nvenc", "libx265") and encoder_ok("libx265"): return "libx265"
+    return "libx264"
+
+def _rate(text):
+    num, _, den = (text or "").partition("/")
+    try: return float(num) / float(den or 1) if float(den or 1) else None
+    except ValueError: return None
+
+def media_info(path):
+    # {'width', 'height', 'fps', 'duration'} (None where the file has no video or no duration),
+    # or None if ffprobe can't read the file
+    try: st = os.stat(path)
+    except OSError: return None
+    key = render_cache.text_digest(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        if key in _media: return _media[key]
+    cache_path = os.path.join(render_cache.cache_dir("probe"), f"media_{key}.json")
+    try:
+        with open(cache_path, 'r', encoding="utf-8") as f: info = json.load(f)
+    except (OSError, ValueError):
+        try:
+            res = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+                                  'stream=width,height,avg_frame_rate,r_frame_rate:format=duration', '-of', 'json', path],
+                                 capture_output=True, text=True)
+            data = json.loads(res.stdout)
+        except (OSError, ValueError):
+            return None
+        if res.returncode != 0: return None
+        stream = (data.get('streams') or [{}])[0]
+        try: duration = float(data.get('format', {}).get('duration'))
+        except (TypeError, ValueError): duration = None
+        info = {'width': stream.get('width'), 'height': stream.get('height'),
+                'fps': _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')), 'duration': duration}
+        tmp = cache_path + ".tmp"
+        with open(tmp, 'w', encoding="utf-8") as f: json.dump(info, f)
+        os.replace(tmp, cache_path)
+    with _lock: _media[key] = info
+    return info
+
+def cuda_available():
+    global _cuda
+    if _cuda is None:
+        try:
+            import torch
+            _cuda = torch.cuda.is_available()
+        except ImportError:
+            _cuda = False
+    return _cuda
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show (or re-run) the cached encoder capability probe")
+    parser.add_argument("--refresh", action="store_true", help="ignore the cache and test every encoder again")
+    parser.add_argument("--cuda", action="store_true", help="also check CUDA for Whisper (imports torch)")
+    parser.add_argument("media", nargs="*", help="media files to show size, frame rate and duration of")
+    args = parser.parse_args(argv)
+    for path in args.media:
+        info = media_info(path)
+        if info is None: print(f"{path}: unreadable")
+        else: print(f"{path}: {info['width']}x{info['height']} @ {info['fps'] and round(info['fps'], 3)} fps, {info['duration']} s")
+    if args.media: return 0
+    print(ffmpeg_version() or "ffmpeg not found")
+    for name, result in encoders(args.refresh).items():
+        print(f"{name:12s} {'OK' if result['ok'] else 'unavailable: ' + result.get('error', '')}")
+    if args.cuda: print(f"CUDA (torch): {'yes' if cuda_available() else 'no'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
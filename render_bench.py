@@ -0,0 +1,197 @@
+# Render benchmarks on synthetic input (lavfi sources, see setup_dummy.py), so changes can be
+# compared without a real recording:
+#   mask   - camera shape: per-pixel geq vs precomputed mask
+#   suite  - end to end per cam_shape/codec/cursor mode; results go to a JSON file and can be
+#            checked against a previous run with --baseline
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import render_cache
+from cursor_data import SIDECAR_NAME, load_cursor_data, parse_cursor_json
+from probe import ffmpeg_version
+from setup_dummy import setup_dummy
+from video_engine import VideoRenderer, camera_mask_path, probe_duration
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def camera_geq(shape, w, h, radius=20):
+    # The per-pixel alpha expression the engine used before masks were precomputed
+    if shape == "circle":
+        r = min(w, h) / 2
+        return f"geq=lum='p(X,Y)':a='if(lte(pow(X-{w/2},2)+pow(Y-{h/2},2),{r*r}),255,0)'"
+    return (f"geq=lum='p(X,Y)':a='if(lte(pow(max(0,abs(X-{w/2})-{w/2-radius}),2)+pow(max(0,abs(Y-{h/2})-{h/2-radius}),2),"
+            f"{radius*radius}),255,0)'")
+
+def time_graph(inputs, graph, frames, repeat=3):
+    # Best-of-N frames per second for decoding + filtering only
+    cmd = ['ffmpeg', '-hide_banner', '-nostats', '-v', 'error', *inputs, '-filter_complex', graph,
+           '-map', '[out]', '-frames:v', str(frames), '-f', 'null', '-']
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        if res.returncode != 0: raise RuntimeError(res.stderr.strip() or "ffmpeg failed")
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return frames / best
+
+def bench_camera_mask(shape="rounded", w=280, h=157, radius=20, feather=0, frames=3000, source="1280x720", repeat=3):
+    cam = ['-f', 'lavfi', '-i', f"testsrc2=size={source}:rate=30"]
+    pre = f"[0:v] scale={w}:{h}, format=rgba"
+    geq_fps = time_graph(cam, f"{pre}, {camera_geq(shape, w, h, radius)} [out]", frames, repeat)
+    mask = camera_mask_path(shape, w, h, radius, feather)
+    mask_fps = time_graph([*cam, '-i', mask], f"{pre} [cam]; [1:v] format=gray [mask]; [cam][mask] alphamerge [out]", frames, repeat)
+    return {'shape': shape, 'size': f"{w}x{h}", 'frames': frames, 'geq_fps': round(geq_fps, 1),
+            'mask_fps': round(mask_fps, 1), 'speedup': round(mask_fps / geq_fps, 2)}
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+def run_measured(cmd):
+    # -> (returncode, seconds, frames, peak RSS in MB or None, stderr tail) for one ffmpeg run
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    with tempfile.TemporaryFile(mode="w+", errors="replace") as err:
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True)
+        frames = 0
+        for line in proc.stdout:
+            if line.startswith("frame="): frames = int(line[6:].strip() or 0)
+        rss = None
+        if hasattr(os, "wait4"):
+            # wait4 gives the rusage of this child alone; ru_maxrss is KiB on Linux, bytes on macOS
+            _, status, usage = os.wait4(proc.pid, 0)
+            returncode = os.waitstatus_to_exitcode(status)
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+            proc.returncode = returncode
+        else:
+            returncode = proc.wait()
+        seconds = time.perf_counter() - started
+        err.seek(0)
+        return returncode, seconds, frames, rss, err.read()[-2000:]
+
+def synthetic_project(duration=60, resolution="1920x1080", fps=30, cursor_rate=60):
+    # Generated once per parameter set and kept in the render cache
+    root = os.path.join(render_cache.cache_dir("bench"), f"synth_{duration:g}s_{resolution}_{fps}fps_{cursor_rate:g}ev")
+    if not os.path.exists(os.path.join(root, 'segments', 'segment-0', 'audio-input.ogg')):
+        setup_dummy(root, duration, resolution, fps, events_per_sec=cursor_rate)
+    return root
+
+def bench_suite(project_dir, shapes=("rounded", "circle", "rect"), codecs=("libx264",), modes=("expr", "sendcmd"),
+                duration=None, log=print):
+    quiet = lambda msg: None
+    work_dir = tempfile.mkdtemp(prefix="capso-bench-")
+    renderer = VideoRenderer(project_dir)
+    renderer.work_dir = work_dir
+    cursor_json = os.path.join(renderer.segment_dir, 'cursor.json')
+
+    # Cursor ingest: full JSON parse, then the memory-mapped sidecar it leaves behind
+    _, json_s = _timed(parse_cursor_json, cursor_json)
+    sidecar = os.path.join(renderer.segment_dir, SIDECAR_NAME)
+    if os.path.exists(sidecar): os.remove(sidecar)
+    load_cursor_data(cursor_json, quiet)
+    _, sidecar_s = _timed(load_cursor_data, cursor_json, quiet)
+
+    total = duration or probe_duration(os.path.join(renderer.segment_dir, 'display.mp4'))
+    results = []
+    for shape, codec, mode in itertools.product(shapes, codecs, modes):
+        renderer.cam_shape, renderer.cursor_mode = shape, mode
+        track, track_s = _timed(renderer.load_track, duration, quiet)
+        filter_file = os.path.join(work_dir, f"filter_{shape}_{mode}.txt")
+        _, script_s = _timed(renderer.write_filter_script, filter_file, os.path.join(work_dir, f"track_{mode}.cmd"),
+                             track, total or track.times[-1], None, quiet)
+        inputs = renderer._inputs()
+        out = os.path.join(work_dir, f"out_{shape}_{codec}_{mode}.mp4")
+        cmd = renderer._render_cmd(inputs, filter_file, codec, out, duration)
+        init = run_measured([*cmd[:-1], '-frames:v', '1', out])
+        full = run_measured(cmd)
+        record = {'cam_shape': shape, 'codec': codec, 'cursor_mode': mode, 'track_s': round(track_s, 4),
+                  'script_build_s': round(script_s, 4), 'script_bytes': os.path.getsize(filter_file),
+                  'ffmpeg_init_s': round(init[1], 3), 'render_s': round(full[1], 3), 'frames': full[2],
+                  'render_fps': round(full[2] / full[1], 1) if full[1] else None,
+                  'peak_rss_mb': round(full[3], 1) if full[3] is not None else None, 'ok': full[0] == 0}
+        if full[0] != 0: record['error'] = full[4].strip().splitlines()[-1:] or ["ffmpeg failed"]
+        log(f"{shape:8s} {codec:11s} {mode:8s} init {record['ffmpeg_init_s']:.2f}s  {record['render_fps']} fps  "
+            f"script {record['script_bytes'] / 1024:.0f} KB in {script_s:.3f}s  rss {record['peak_rss_mb']} MB")
+        results.append(record)
+        if os.path.exists(out): os.remove(out)
+
+    return {'created': datetime.datetime.now().isoformat(timespec="seconds"), 'ffmpeg': ffmpeg_version(),
+            'machine': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+            'project': os.path.abspath(project_dir), 'duration': total,
+            'json_parse_s': round(json_s, 4), 'sidecar_load_s': round(sidecar_s, 4),
+            'python_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) if resource else None,
+            'results': results}
+
+def compare(current, baseline, tolerance=0.1):
+    # Regressions beyond `tolerance` (fraction) on matching shape/codec/mode rows
+    key = lambda r: (r['cam_shape'], r['codec'], r['cursor_mode'])
+    base = {key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in current['results']:
+        b = base.get(key(r))
+        if not b: continue
+        if b.get('render_fps') and r.get('render_fps') is not None and r['render_fps'] < b['render_fps'] * (1 - tolerance):
+            regressions.append(f"{key(r)}: render_fps {b['render_fps']} -> {r['render_fps']}")
+        for metric in ('ffmpeg_init_s', 'script_build_s', 'peak_rss_mb'):
+            # Ignore noise on tiny values
+            if b.get(metric) and r.get(metric) is not None and r[metric] > max(b[metric] * (1 + tolerance), b[metric] + 0.05):
+                regressions.append(f"{key(r)}: {metric} {b[metric]} -> {r[metric]}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("mask", help="camera shape: per-pixel geq vs precomputed mask")
+    p.add_argument("--shape", choices=["circle", "rounded"], default="rounded")
+    p.add_argument("--width", type=int, default=280)
+    p.add_argument("--height", type=int, default=157)
+    p.add_argument("--radius", type=int, default=20)
+    p.add_argument("--feather", type=float, default=0)
+    p.add_argument("--frames", type=int, default=3000)
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = sub.add_parser("suite", help="end-to-end render benchmark per cam_shape/codec/cursor mode")
+    p.add_argument("--project", default=None, help="project folder (default: generate a synthetic one)")
+    p.add_argument("--duration", type=float, default=30, help="synthetic length, or render limit for --project")
+    p.add_argument("--resolution", default="1920x1080")
+    p.add_argument("--fps", type=int, default=30)
+    p.add_argument("--cursor-rate", type=float, default=60, help="synthetic cursor events per second")
+    p.add_argument("--shapes", default="rounded,circle,rect")
+    p.add_argument("--codecs", default="libx264")
+    p.add_argument("--modes", default="expr,sendcmd")
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--baseline", default=None, help="previous results file; exit 1 on regressions")
+    p.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.bench == "suite":
+        project = args.project or synthetic_project(args.duration, args.resolution, args.fps, args.cursor_rate)
+        report = bench_suite(project, args.shapes.split(","), args.codecs.split(","), args.modes.split(","),
+                             args.duration if args.project else None)
+        with open(args.out, 'w', encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+        if args.baseline:
+            with open(args.baseline, 'r', encoding="utf-8") as f: regressions = compare(report, json.load(f), args.tolerance)
+            for line in regressions: print(f"[REGRESSION] {line}")
+            if regressions: return 1
+            print("No regressions against baseline")
+        return 0
+
+    r = bench_camera_mask(args.shape, args.width, args.height, args.radius, args.feather, args.frames, repeat=args.repeat)
+    print(f"{r['shape']} {r['size']}, {r['frames']} frames: geq {r['geq_fps']} fps, mask {r['mask_fps']} fps ({r['speedup']}x)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
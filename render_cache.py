@@ -0,0 +1,74 @@
+# Shared on-disk cache helpers: one cache root per user, content hashes of input files,
+# and size-bounded LRU pruning (entries are touched on every hit).
+import hashlib
+import os
+import threading
+import time
+
+_digests = {}
+_digest_lock = threading.Lock()
+
+def cache_root():
+    root = os.environ.get("CAPSO_RENDER_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "capso-render")
+    os.makedirs(root, exist_ok=True)
+    return root
+
+def cache_dir(name):
+    path = os.path.join(cache_root(), name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def file_digest(path, chunk_size=1 << 20):
+    # sha256 of the file contents, remembered per (path, size, mtime) for this process
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        if memo_key in _digests: return _digests[memo_key]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""): h.update(chunk)
+    with _digest_lock: _digests[memo_key] = h.hexdigest()
+    return _digests[memo_key]
+
+def text_digest(*parts):
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+def touch(path):
+    try: os.utime(path, None)
+    except OSError: pass
+
+def entries(directory):
+    # (path, size, last_used) for every file, least recently used first
+    out = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            out.append((path, st.st_size, st.st_mtime))
+    return sorted(out, key=lambda e: e[2])
+
+def _in_progress(path, last_used):
+    # Files another render is still writing (renamed into place when done); after a day they're abandoned
+    name = os.path.basename(path)
+    return (".part." in name or ".tmp" in name) and time.time() - last_used < 86400
+
+def prune(directory, max_bytes):
+    # Drop least recently used files until the directory fits in max_bytes
+    items = [e for e in entries(directory) if not _in_progress(e[0], e[2])]
+    total = sum(size for _, size, _ in items)
+    removed = 0
+    for path, size, _ in items:
+        if total <= max_bytes: break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError: pass
+    return removed
+
+def clear(directory):
+    items = entries(directory)
+    for path, _, _ in items:
+        try: os.remove(path)
+        except OSError: pass
+    return len(items)
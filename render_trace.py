@@ -0,0 +1,102 @@
+# Render tracing: wall time, CPU time and peak memory per stage of a render, with the sizes that
+# explain them (cursor moves, filter script bytes, audio length, ...) and ffmpeg's own timing.
+# The report is written as <output>.trace.json; totals() sums stages over one or many reports,
+# so batch runs can compare where the time went across jobs.
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+def peak_rss_mb():
+    # Peak resident memory of this process so far, or None where it can't be read
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 2 ** 20, 1)
+        except (ImportError, AttributeError):
+            return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (2 ** 20 if sys.platform == "darwin" else 1024), 1)
+
+def _children_cpu():
+    # CPU time of finished child processes (ffmpeg); always 0 on Windows
+    t = os.times()
+    return t.children_user + t.children_system
+
+class RenderTrace:
+    def __init__(self, **info):
+        self.info = info
+        self.stages = []
+        self.started = time.time()
+        self._cpu = time.process_time()
+        self._children = _children_cpu()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, **sizes):
+        # Times the block; the yielded dict takes sizes only known at the end. CPU time is the
+        # whole process, so stages running in parallel threads share it
+        record = {'stage': name, 'start_s': round(time.time() - self.started, 3), **sizes}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.update(wall_s=round(time.perf_counter() - wall, 3), cpu_s=round(time.process_time() - cpu, 3), peak_rss_mb=peak_rss_mb())
+            with self._lock: self.stages.append(record)
+
+    def ffmpeg(self, name, stats, **fields):
+        # A finished ffmpeg run, from ffmpeg_progress.run_ffmpeg(stats=...)
+        record = {'stage': name, 'start_s': round(stats.pop('started', self.started) - self.started, 3), **fields, **stats}
+        with self._lock: self.stages.append(record)
+
+    def report(self, **extra):
+        with self._lock: stages = sorted(self.stages, key=lambda s: s['start_s'])
+        return {**self.info, **extra, 'started': self.started, 'wall_s': round(time.time() - self.started, 3),
+                'cpu_s': round(time.process_time() - self._cpu, 3), 'children_cpu_s': round(_children_cpu() - self._children, 3),
+                'peak_rss_mb': peak_rss_mb(), 'stages': stages}
+
+def report_path(output_file): return os.path.splitext(output_file)[0] + ".trace.json"
+
+def write_report(report, path):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding="utf-8") as f: json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+def totals(reports):
+    # {stage: {'count', 'wall_s', 'cpu_s'}} over one report or a list of them, slowest first;
+    # ffmpeg runs count their own CPU (utime + stime)
+    if isinstance(reports, dict): reports = [reports]
+    out = {}
+    for report in reports:
+        for s in report['stages']:
+            t = out.setdefault(s['stage'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            t['count'] += 1
+            t['wall_s'] = round(t['wall_s'] + s.get('wall_s', 0.0), 3)
+            t['cpu_s'] = round(t['cpu_s'] + s.get('cpu_s', s.get('utime_s', 0.0) + s.get('stime_s', 0.0)), 3)
+    return dict(sorted(out.items(), key=lambda item: -item[1]['wall_s']))
+
+def summary(report, top=4):
+    # One line: total wall time and the slowest stages (parallel runs are summed)
+    parts = [f"{name} {t['wall_s']:.1f}s" + (f" x{t['count']}" if t['count'] > 1 else "") for name, t in list(totals(report).items())[:top]]
+    return f"{report['wall_s']:.1f}s total; " + ", ".join(parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sum the stages of one or more render trace reports")
+    parser.add_argument("reports", nargs="+", help="*.trace.json files")
+    args = parser.parse_args(argv)
+    reports = []
+    for path in args.reports:
+        with open(path, 'r', encoding="utf-8") as f: reports.append(json.load(f))
+    wall = sum(r['wall_s'] for r in reports)
+    print(f"{len(reports)} renders, {wall:.1f}s wall")
+    for name, t in totals(reports).items():
+        print(f"  {name:24s} {t['count']:5d}x  {t['wall_s']:9.2f}s wall  {t['cpu_s']:9.2f}s cpu")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,8 @@
 import json
 import subprocess
 import os
-import sys
-
-# Increase recursion depth for deep expression trees
-sys.setrecursionlimit(200000)
-
-def build_tree(times, values, start, end):
-    if start == end:
-        return f"{values[start]:.2f}"
-    mid = (start + end) // 2
-    return f"if(lt(t,{times[mid]:.4f}),{build_tree(times, values, start, mid)},{build_tree(times, values, mid + 1, end)})"
+from expr_tree import write_step_tree
+from video_engine import camera_mask_path
 
 def generate_render_script(duration_limit=None):
     print(f"Loading cursor.json...")
@@ -30,11 +22,6 @@ def generate_render_script(duration_limit=None):
     ys = [m['y'] * 1080 for m in moves]
     ids = [int(m['cursor_id']) for m in moves]
 
-    print(f"Building expression trees ({len(moves)} points)...")
-    x_expr = build_tree(times, xs, 0, len(moves) - 1)
-    y_expr = build_tree(times, ys, 0, len(moves) - 1)
-    id_expr = build_tree(times, ids, 0, len(moves) - 1)
-
     print(f"Building FFmpeg command...")
     
     inputs = [
@@ -44,10 +31,13 @@ def generate_render_script(duration_limit=None):
     ]
     for i in range(11):
         inputs.extend(['-i', f'cursors/cursor_{i}.png'])
+    inputs.extend(['-i', camera_mask_path("rounded", 360, 202, 20)])
 
     filters = []
     # Camera overlay
-    filters.append("[1:v] scale=360:202, format=rgba, geq=lum='p(X,Y)':a='if(lte(pow(max(0,abs(X-180)-160),2)+pow(max(0,abs(Y-101)-81),2),400),255,0)' [cam];")
+    filters.append("[14:v] format=gray [cam_mask];")
+    filters.append("[1:v] scale=360:202, format=rgba [cam_scaled];")
+    filters.append("[cam_scaled][cam_mask] alphamerge [cam];")
     filters.append("[0:v][cam] overlay=W-w-20:20 [bg];")
     
     # Pad and stack cursors
@@ -56,11 +46,19 @@ def generate_render_script(duration_limit=None):
     
     cursor_pads = "".join([f"[cp{i}]" for i in range(11)])
     filters.append(f"{cursor_pads} vstack=inputs=11 [atlas];")
-    filters.append(f"[atlas] crop=32:32:0:'({id_expr})*32' [cursor];")
-    filters.append(f"[bg][cursor] overlay=x='{x_expr}':y='{y_expr}':eval=frame [outv];")
     
+    # Expression trees are streamed straight into the script
+    print(f"Writing expression trees ({len(moves)} points)...")
+    n = len(moves) - 1
     with open('filter_script.txt', 'w') as f:
         f.write("\n".join(filters))
+        f.write("\n[atlas] crop=32:32:0:'(")
+        write_step_tree(f, times, ids, 0, n)
+        f.write(")*32' [cursor];\n[bg][cursor] overlay=x='")
+        write_step_tree(f, times, xs, 0, n)
+        f.write("':y='")
+        write_step_tree(f, times, ys, 0, n)
+        f.write("':eval=frame [outv];")
 
     cmd = [
         'ffmpeg', '-y',
@@ -1,28 +1,93 @@
 import os
 import json
+import math
+import random
+import argparse
+import subprocess
 
-def setup_dummy():
-    folders = [
-        'cursors',
-        'segments/segment-0'
-    ]
+# Synthetic Cap.so project: lavfi test media plus a generated cursor.json, so renders and
+# benchmarks can run anywhere without a real recording.
+
+def synth_cursor(duration, events_per_sec=60, clicks_per_min=20, cursor_ids=11, seed=0):
+    rnd = random.Random(seed)
+    moves, clicks = [], []
+    n = max(2, int(duration * events_per_sec))
+    cid = 0
+    # Smooth wandering path: a few slow sines plus jitter, normalized to 0..1
+    fx, fy = [rnd.uniform(0.05, 0.3) for _ in range(3)], [rnd.uniform(0.05, 0.3) for _ in range(3)]
+    for i in range(n):
+        t = i * duration / (n - 1)
+        x = 0.5 + sum(0.15 * math.sin(f * t * 2 * math.pi + k) for k, f in enumerate(fx)) + rnd.uniform(-0.002, 0.002)
+        y = 0.5 + sum(0.15 * math.cos(f * t * 2 * math.pi + k) for k, f in enumerate(fy)) + rnd.uniform(-0.002, 0.002)
+        if rnd.random() < 0.5 / events_per_sec: cid = rnd.randrange(cursor_ids)
+        moves.append({"cursor_id": str(cid), "time_ms": round(t * 1000), "x": min(max(x, 0.0), 1.0), "y": min(max(y, 0.0), 1.0)})
+    for _ in range(int(duration / 60 * clicks_per_min)):
+        t = rnd.uniform(0, max(duration - 0.2, 0))
+        clicks.append({"down": True, "time_ms": round(t * 1000)})
+        clicks.append({"down": False, "time_ms": round((t + rnd.uniform(0.05, 0.2)) * 1000)})
+    clicks.sort(key=lambda c: c["time_ms"])
+    return {"moves": moves, "clicks": clicks}
+
+def _ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', *args], check=True)
+
+def synth_media(seg_dir, duration, resolution="1920x1080", fps=30, cam_resolution="1280x720"):
+    _ffmpeg('-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate={fps}", '-t', str(duration),
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', os.path.join(seg_dir, 'display.mp4'))
+    _ffmpeg('-f', 'lavfi', '-i', f"testsrc=size={cam_resolution}:rate=30", '-t', str(duration),
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', os.path.join(seg_dir, 'camera.mp4'))
+    # 5s of "speech" (a tone) then 3s of silence, so silence detection has something to find
+    _ffmpeg('-f', 'lavfi', '-i', "aevalsrc='0.3*sin(440*2*PI*t)*lt(mod(t,8),5)':s=48000", '-t', str(duration),
+            '-c:a', 'libopus', '-b:a', '64k', os.path.join(seg_dir, 'audio-input.ogg'))
+
+def synth_cursors(cursor_dir, count=11, size=32):
+    # Arrow-ish triangles in different colours
+    for i in range(count):
+        color = f"0x{(i * 0x3A5F1B + 0x404040) & 0xFFFFFF:06X}"
+        _ffmpeg('-f', 'lavfi', '-i', f"color=c={color}:s={size}x{size},format=rgba,geq=r='r(X,Y)':g='g(X,Y)':b='b(X,Y)':a='if(lte(X,Y),255,0)'",
+                '-frames:v', '1', os.path.join(cursor_dir, f'cursor_{i}.png'))
+
+def setup_dummy(root=".", duration=None, resolution="1920x1080", fps=30, cam_resolution="1280x720",
+                events_per_sec=60, clicks_per_min=20, segments=1, seed=0):
+    # duration=None keeps the old behaviour: folder structure and a two-point cursor.json only
+    folders = [os.path.join(root, 'cursors')] + [os.path.join(root, 'segments', f'segment-{i}') for i in range(segments)]
     for f in folders:
         os.makedirs(f, exist_ok=True)
-    
-    # Create a dummy cursor.json
-    dummy_cursor = {
-        "moves": [
-            {"cursor_id": "0", "time_ms": 0, "x": 0.1, "y": 0.1},
-            {"cursor_id": "0", "time_ms": 1000, "x": 0.9, "y": 0.9}
-        ],
-        "clicks": []
-    }
-    
-    with open('segments/segment-0/cursor.json', 'w') as f:
-        json.dump(dummy_cursor, f)
-        
-    print("Dummy structure created.")
-    print("Note: You still need real camera.mp4, display.mp4, and audio-input.ogg to render.")
+
+    if duration is None:
+        dummy_cursor = {
+            "moves": [
+                {"cursor_id": "0", "time_ms": 0, "x": 0.1, "y": 0.1},
+                {"cursor_id": "0", "time_ms": 1000, "x": 0.9, "y": 0.9}
+            ],
+            "clicks": []
+        }
+        with open(os.path.join(root, 'segments/segment-0/cursor.json'), 'w') as f:
+            json.dump(dummy_cursor, f)
+        print("Dummy structure created.")
+        print("Note: You still need real camera.mp4, display.mp4, and audio-input.ogg to render.")
+        return root
+
+    synth_cursors(os.path.join(root, 'cursors'))
+    for i in range(segments):
+        seg_dir = os.path.join(root, 'segments', f'segment-{i}')
+        with open(os.path.join(seg_dir, 'cursor.json'), 'w') as f:
+            json.dump(synth_cursor(duration, events_per_sec, clicks_per_min, seed=seed + i), f)
+        synth_media(seg_dir, duration, resolution, fps, cam_resolution)
+    print(f"Synthetic project created in {os.path.abspath(root)} ({segments} x {duration}s, {resolution}@{fps})")
+    return root
 
 if __name__ == "__main__":
-    setup_dummy()
+    parser = argparse.ArgumentParser(description="Create a dummy or fully synthetic Cap.so project")
+    parser.add_argument("root", nargs="?", default=".")
+    parser.add_argument("--duration", type=float, default=None, help="seconds of synthetic media (omit for structure only)")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--cam-resolution", default="1280x720")
+    parser.add_argument("--cursor-rate", type=float, default=60, help="cursor move events per second")
+    parser.add_argument("--clicks-per-min", type=float, default=20)
+    parser.add_argument("--segments", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    setup_dummy(args.root, args.duration, args.resolution, args.fps, args.cam_resolution,
+                args.cursor_rate, args.clicks_per_min, args.segments, args.seed)
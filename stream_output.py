@@ -0,0 +1,83 @@
+# Streaming output: the render is written through ffmpeg's tee muxer to an HLS "event" playlist
+# (MPEG-TS or fragmented-MP4 segments) and, from the same encode, to the regular MP4 with
+# faststart. ffmpeg rewrites the playlist after every finished segment, so an uploader can push
+# segments while the encode is still running; SegmentWatcher reports each one as it lands.
+import os
+import shutil
+import threading
+
+FORMATS = ("hls", "fmp4")
+
+def stream_dir(output_file): return os.path.splitext(output_file)[0] + "_stream"
+
+def playlist_path(output_file): return os.path.join(stream_dir(output_file), "index.m3u8")
+
+def _tee_path(path):
+    # The tee muxer treats backslashes as escapes
+    return path.replace("\\", "/")
+
+def output_args(output_file, fmt="fmp4", segment_seconds=4.0):
+    # ffmpeg output arguments (after maps and codecs) writing the playlist and output_file at once;
+    # every stream must be mapped explicitly
+    if fmt not in FORMATS: raise ValueError(f"unknown stream format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    os.makedirs(stream_dir(output_file), exist_ok=True)
+    # temp_file: segments appear under their final name only once complete
+    hls = f"f=hls:hls_time={segment_seconds:g}:hls_playlist_type=event:hls_flags=independent_segments+temp_file"
+    if fmt == "fmp4": hls += ":hls_segment_type=fmp4"
+    return ['-f', 'tee', f"[{hls}]{_tee_path(playlist_path(output_file))}|[f=mp4:movflags=+faststart]{_tee_path(output_file)}"]
+
+def reset(output_file):
+    # Drops segments of an earlier (or failed) attempt
+    shutil.rmtree(stream_dir(output_file), ignore_errors=True)
+    os.makedirs(stream_dir(output_file), exist_ok=True)
+
+def read_playlist(path):
+    # -> (init segment name or None, [(duration, segment name), ...], ended)
+    try:
+        with open(path, 'r', encoding="utf-8") as f: lines = f.read().splitlines()
+    except OSError:
+        return None, [], False
+    init, segments, duration = None, [], None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXT-X-MAP:"): init = line.split('URI="', 1)[-1].split('"', 1)[0]
+        elif line.startswith("#EXTINF:"):
+            try: duration = float(line[8:].split(",", 1)[0])
+            except ValueError: duration = None
+        elif line and not line.startswith("#") and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return init, segments, "#EXT-X-ENDLIST" in lines
+
+class SegmentWatcher:
+    # Polls the playlist while ffmpeg writes it and calls callback(info) once per finished segment:
+    # {'index', 'path', 'duration', 'start', 'init', 'playlist'}; the last poll runs on exit
+    def __init__(self, playlist, callback, interval=0.5):
+        self.playlist, self.callback, self.interval = playlist, callback, interval
+        self.count, self.start = 0, 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.poll()
+
+    def _run(self):
+        while not self._stop.wait(self.interval): self.poll()
+
+    def poll(self):
+        directory = os.path.dirname(self.playlist)
+        init, segments, _ = read_playlist(self.playlist)
+        for duration, name in segments[self.count:]:
+            path = os.path.join(directory, name)
+            # The playlist may be caught mid-write; wait for the segment file itself
+            if not os.path.exists(path): break
+            self.callback({'index': self.count, 'path': path, 'duration': duration, 'start': round(self.start, 3),
+                           'init': os.path.join(directory, init) if init else None, 'playlist': self.playlist})
+            self.count += 1
+            self.start += duration
@@ -0,0 +1,270 @@
+# Whisper transcription helpers:
+# - TranscriptionCache: output keyed by audio content hash + model + backend + language, so
+#   re-renders that only change caption styling regenerate ASS/SRT without loading a model.
+# - TranscriptionWorker: a long-lived process that keeps loaded models in memory between
+#   renders and streams segments back while it transcribes.
+# - transcribe_parallel: CPU mode that cuts the audio at silences and spreads the speech
+#   chunks over a process pool.
+import argparse
+import importlib.util
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import render_cache
+
+def backend_available(backend):
+    return importlib.util.find_spec("faster_whisper" if backend == "faster-whisper" else "whisper") is not None
+
+def load_model(backend, model_name, device, compute_type, cpu_threads=0):
+    if backend == "faster-whisper":
+        from faster_whisper import WhisperModel
+        return WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    import whisper
+    if cpu_threads:
+        import torch
+        torch.set_num_threads(cpu_threads)
+    return whisper.load_model(model_name, device=device)
+
+def run_model(model, backend, audio_path, language):
+    # Yields {'start', 'end', 'text'} dicts; faster-whisper produces them as it decodes
+    if backend == "faster-whisper":
+        segments, info = model.transcribe(audio_path, language=language, beam_size=5)
+        for s in segments: yield {'start': s.start, 'end': s.end, 'text': s.text}
+    else:
+        result = model.transcribe(audio_path, language=language, verbose=False)
+        for s in result['segments']: yield {'start': s['start'], 'end': s['end'], 'text': s['text']}
+
+class TranscriptionCache:
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or render_cache.cache_dir("transcripts")
+        self.max_bytes = max_bytes
+
+    def key(self, audio_path, model, backend, language):
+        return render_cache.text_digest(render_cache.file_digest(audio_path), model, backend, language)
+
+    def _path(self, key): return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding="utf-8") as f: data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        render_cache.touch(path)
+        return data['segments']
+
+    def put(self, key, segments, **meta):
+        path = self._path(key)
+        data = {'meta': {**meta, 'created': time.time()},
+                'segments': [{'start': s['start'], 'end': s['end'], 'text': s['text']} for s in segments]}
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding="utf-8") as f: json.dump(data, f)
+        os.replace(tmp, path)
+        render_cache.prune(self.directory, self.max_bytes)
+
+    def entries(self):
+        out = []
+        for path, size, last_used in render_cache.entries(self.directory):
+            if not path.endswith(".json"): continue
+            try:
+                with open(path, 'r', encoding="utf-8") as f: meta = json.load(f).get('meta', {})
+            except (OSError, ValueError):
+                meta = {}
+            out.append({'key': os.path.basename(path)[:-5], 'size': size, 'last_used': last_used, **meta})
+        return out
+
+    def clear(self):
+        return render_cache.clear(self.directory)
+
+def speech_spans(audio_path, noise_db=-35, min_silence=0.6):
+    # Voice-activity pass with ffmpeg silencedetect: [(start, end)] of non-silent audio
+    res = subprocess.run(['ffmpeg', '-hide_banner', '-nostats', '-i', audio_path, '-af',
+                          f'silencedetect=n={noise_db}dB:d={min_silence}', '-f', 'null', '-'],
+                         capture_output=True, text=True, errors="replace")
+    m = re.search(r"Duration: (\d+):(\d+):([\d.]+)", res.stderr)
+    if not m: raise RuntimeError(f"could not read duration of {audio_path}")
+    duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+    spans, pos, silent = [], 0.0, False
+    for kind, value in re.findall(r"silence_(start|end): (-?[\d.]+)", res.stderr):
+        t = min(max(float(value), 0.0), duration)
+        if kind == "start":
+            if t > pos: spans.append((pos, t))
+            silent = True
+        else:
+            pos, silent = t, False
+    # An open silence_start means the file ends in silence
+    if not silent and pos < duration: spans.append((pos, duration))
+    return [(s, e) for s, e in spans if e - s > 0.05], duration
+
+def plan_chunks(spans, chunk_seconds):
+    # Every detected silence is a cut; speech longer than chunk_seconds is split evenly
+    chunks = []
+    for s, e in spans:
+        n = max(1, math.ceil((e - s) / chunk_seconds))
+        step = (e - s) / n
+        chunks.extend((s + i * step, s + (i + 1) * step) for i in range(n))
+    return chunks
+
+_pool_model = None
+
+def _init_pool_worker(backend, model_name, compute_type, threads):
+    global _pool_model
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"): os.environ[var] = str(threads)
+    _pool_model = (backend, load_model(backend, model_name, "cpu", compute_type, threads))
+
+def _transcribe_chunk(audio_path, start, end, language, tmp_dir):
+    started = time.time()
+    wav = os.path.join(tmp_dir, f"chunk_{start:09.3f}.wav")
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', audio_path,
+                    '-ac', '1', '-ar', '16000', wav], check=True, capture_output=True)
+    backend, model = _pool_model
+    segments = [{'start': seg['start'] + start, 'end': min(seg['end'] + start, end), 'text': seg['text']}
+                for seg in run_model(model, backend, wav, language)]
+    os.remove(wav)
+    return segments, time.time() - started
+
+def transcribe_parallel(audio_path, backend, model_name, language, workers=None, chunk_seconds=30.0, threads=2,
+                        compute_type="int8", log=print):
+    # CPU only: each worker process loads its own model limited to `threads` threads
+    workers = workers or max(1, (os.cpu_count() or 2) // threads)
+    started = time.time()
+    spans, duration = speech_spans(audio_path)
+    chunks = plan_chunks(spans, chunk_seconds)
+    speech = sum(e - s for s, e in chunks)
+    log(f"[AI] VAD: {len(chunks)} speech chunks, {speech:.1f}s of {duration:.1f}s audio; "
+        f"{workers} workers x {threads} threads")
+    if not chunks: return []
+    tmp_dir = tempfile.mkdtemp(prefix="capso-vad-")
+    results, busy = [], 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_pool_worker, initargs=(backend, model_name, compute_type, threads)) as pool:
+            # Longest first keeps the pool evenly loaded at the end
+            order = sorted(chunks, key=lambda c: c[0] - c[1])
+            futures = [pool.submit(_transcribe_chunk, audio_path, s, e, language, tmp_dir) for s, e in order]
+            for i, fut in enumerate(futures):
+                segments, seconds = fut.result()
+                results.extend(segments)
+                busy += seconds
+                log(f"[AI] Transcribed chunk {i + 1}/{len(futures)}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    wall = time.time() - started
+    # Sequential estimate = the same chunks run back to back (excludes per-worker model loads)
+    log(f"[AI] Parallel transcription took {wall:.1f}s vs ~{busy:.1f}s sequential ({busy / wall:.1f}x), "
+        f"skipped {duration - speech:.1f}s of silence")
+    return sorted(results, key=lambda seg: seg['start'])
+
+def _worker_main(requests, results, idle_timeout):
+    models = {}  # (backend, model, device, compute_type) -> [model, last_used]
+    while True:
+        try: msg = requests.get(timeout=min(idle_timeout, 30))
+        except queue.Empty: msg = None
+        now = time.time()
+        for key in [k for k, (_, used) in models.items() if now - used > idle_timeout]: del models[key]
+        if msg is None: continue
+        if msg[0] == "stop": break
+        _, job_id, p = msg
+        try:
+            key = (p['backend'], p['model'], p['device'], p['compute_type'])
+            if key not in models:
+                results.put(("log", job_id, f"[AI] Worker loading {p['backend']} ({p['model']}) on {p['device']}..."))
+                models[key] = [load_model(*key), now]
+            else:
+                results.put(("log", job_id, f"[AI] Worker reusing loaded {p['backend']} ({p['model']})"))
+            entry = models[key]
+            for seg in run_model(entry[0], p['backend'], p['audio'], p['language']):
+                results.put(("segment", job_id, seg))
+            entry[1] = time.time()
+            results.put(("done", job_id, None))
+        except Exception as e:
+            results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+
+class TranscriptionWorker:
+    # Owned by the GUI or a batch runner. Jobs go over a local queue and run one at a time;
+    # models stay loaded until unused for idle_timeout seconds.
+    def __init__(self, idle_timeout=600):
+        self.idle_timeout = idle_timeout
+        self.process = None
+        self._jobs = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.process is not None and self.process.is_alive(): return
+            ctx = multiprocessing.get_context("spawn")
+            self._requests, self._results = ctx.Queue(), ctx.Queue()
+            self.process = ctx.Process(target=_worker_main, args=(self._requests, self._results, self.idle_timeout), daemon=True)
+            self.process.start()
+            self._dispatcher = threading.Thread(target=self._dispatch, args=(self._results,), daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self, results):
+        # Routes worker messages to the job that asked for them
+        while True:
+            kind, job_id, payload = results.get()
+            if kind == "exit": break
+            with self._lock: q = self._jobs.get(job_id)
+            if q is not None: q.put((kind, payload))
+
+    def transcribe(self, audio_path, model, backend, language, device, compute_type, log=None):
+        self._ensure_started()
+        job_id = next(self._ids)
+        q = queue.Queue()
+        with self._lock: self._jobs[job_id] = q
+        self._requests.put(("transcribe", job_id, {'audio': os.path.abspath(audio_path), 'model': model, 'backend': backend,
+                                                   'language': language, 'device': device, 'compute_type': compute_type}))
+        try:
+            while True:
+                try: kind, payload = q.get(timeout=5)
+                except queue.Empty:
+                    if not self.process.is_alive(): raise RuntimeError("transcription worker exited")
+                    continue
+                if kind == "segment": yield payload
+                elif kind == "log":
+                    if log: log(payload)
+                elif kind == "done": return
+                else: raise RuntimeError(f"transcription failed: {payload}")
+        finally:
+            with self._lock: self._jobs.pop(job_id, None)
+
+    def stop(self):
+        with self._lock:
+            if self.process is None: return
+            if self.process.is_alive():
+                self._requests.put(("stop",))
+                self.process.join(5)
+                if self.process.is_alive(): self.process.terminate()
+            self._results.put(("exit", None, None))
+            self.process = None
+        self._dispatcher.join(5)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the transcription cache")
+    parser.add_argument("action", choices=["list", "clear"])
+    args = parser.parse_args(argv)
+    cache = TranscriptionCache()
+    if args.action == "clear":
+        print(f"Removed {cache.clear()} cached transcripts from {cache.directory}")
+        return 0
+    items = cache.entries()
+    for e in items:
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e['last_used']))
+        print(f"{e['key'][:12]}  {e['size'] / 1024:8.1f} KB  {used}  {e.get('model', '?')}/{e.get('backend', '?')}/{e.get('language', '?')}  {e.get('audio', '')}")
+    print(f"{len(items)} entries, {sum(e['size'] for e in items) / 1024 / 1024:.1f} MB in {cache.directory} (limit {cache.max_bytes / 1024 / 1024:.0f} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,63 @@
 import json
 import subprocess
 import os
-import sys
 import math
 import shutil
+import contextlib
+import bisect
+import re
+import copy
+import tempfile
+import threading
+import hashlib
+import time
+import audio_mix
+import encoder_tune
+import idle_detect
+import probe
+import render_cache
+import render_trace
+import stream_output
+from concurrent.futures import ThreadPoolExecutor
+from cursor_track import CursorTrack, write_sendcmd_track, simplify_cursor, smooth_path, merge_runs
+from cursor_data import load_cursor_data
+from transcription import TranscriptionCache, backend_available, load_model, run_model, transcribe_parallel
+from chunk_cache import ChunkCache
+from ffmpeg_progress import Progress, ProgressTracker, format_seconds, run_ffmpeg
+from expr_tree import write_lerp_tree, write_step_tree, lerp_tree, step_tree
 
-sys.setrecursionlimit(200000)
+# Named renditions; aspect crops the composite (follow_cursor pans the crop with the cursor)
+RENDITIONS = {
+    "1080p": {'width': 1920, 'height': 1080},
+    "720p": {'width': 1280, 'height': 720},
+    "vertical": {'width': 1080, 'height': 1920, 'aspect': (9, 16), 'follow_cursor': True},
+}
 
 class VideoRenderer:
     def __init__(self, project_dir):
         self.project_dir = project_dir
-        self.segment_dir = os.path.join(project_dir, 'segments', 'segment-0')
+        # Paused/resumed recordings have segment-1, segment-2, ...; segment_dir is the one being rendered
+        self.segment_dirs = discover_segments(project_dir)
+        self.segment_dir = self.segment_dirs[0]
         self.cursor_dir = os.path.join(project_dir, 'cursors')
         
-        # Default Settings
+        # Output canvas: the display is scaled (and padded) to it before anything is overlaid, so a
+        # 4K capture isn't composited at 4K for a 1080p file. None keeps the display's size / rate;
+        # with one side set the other follows the display's aspect
+        self.output_width = None
+        self.output_height = None
+        self.output_fps = None
+        
+        # Default Settings (camera, cursor and caption sizes are for a 1080p canvas and scale with it)
         self.cam_scale_w = 280
         self.cam_scale_h = 158
         self.cursor_scale = 48
+        # Cursor size while the mouse button is down
+        self.click_scale = 0.85
         self.cam_shape = "rounded"
+        self.cam_radius = 20
+        # Soft mask edge width in px (0 = hard edge)
+        self.cam_feather = 0
         self.cam_margin_x = 20
         self.cam_margin_y = 20
         self.cam_position = "Top-Right"
@@ -30,83 +70,201 @@ class VideoRenderer:
         self.caption_pos = 50
         self.whisper_model = "base" 
         self.use_faster_whisper = False
+        self.caption_language = "id"
+        # Reuse transcripts of identical audio (see transcription.py for list/clear)
+        self.use_transcript_cache = True
+        # CPU only: split the audio at silences and transcribe chunks on a process pool (None = by CPU count)
+        self.whisper_parallel = False
+        self.whisper_workers = None
+        self.whisper_threads = 2
+        self.whisper_chunk_seconds = 30.0
+        
+        # "expr" builds if() expression trees, "sendcmd" drives the cursor from a per-frame track file
+        self.cursor_mode = "expr"
+        # Rate of the sendcmd track and the atlas input; None follows the output (or display) frame rate
+        self.track_fps = None
+        # Max cursor path error (output px) allowed when simplifying moves; 0 keeps every visible point
+        self.cursor_tolerance_px = 0.5
+        
+        # Chunked rendering: None picks counts from the CPU count
+        self.chunked = False
+        self.chunk_count = None
+        self.chunk_workers = None
+        self.chunk_gop_seconds = 2.0
+        self.segment_workers = None
+        # Concurrent NVENC encodes this renderer may start (consumer drivers allow only a few sessions)
+        self.nvenc_sessions = 3
+        # Incremental: fixed-length chunks cached by content, so re-renders only encode changed
+        # time ranges and an interrupted render resumes (see chunk_cache.py)
+        self.incremental = False
+        self.incremental_chunk_seconds = 10.0
+        self.chunk_cache_bytes = 20 * 1024 ** 3
+        
+        # Trim: (start, end) source seconds to keep, joined in order; None keeps everything.
+        # Inputs are seeked to each range, so only kept time is decoded (see parse_ranges)
+        self.keep_ranges = None
+        # Jump-cuts: "drop" or "speed" spans with no cursor activity, no speech and a still screen
+        # (see idle_detect.py); spans shorter than jump_cut_min are left alone
+        self.jump_cuts = None
+        self.jump_cut_min = 3.0
+        self.jump_cut_padding = 0.5
+        self.jump_cut_speed = 8.0
+        
+        # Renditions: extra outputs split from the one composited stream (see generate_renditions);
+        # names from RENDITIONS or dicts with name/width/height/aspect/follow_cursor/codec/crf/bitrate
+        self.renditions = None
+        
+        # Preview: sampled windows at reduced size (see generate_preview)
+        self.preview_windows = 6
+        self.preview_window_seconds = 5.0
+        self.preview_scale = 0.5
+        
+        # Audio: the final track is encoded once per source + mix settings, cached and stream-copied
+        # (see audio_mix.py). voice_lufs normalizes the voice; None leaves it as recorded
+        self.cache_audio = True
+        self.audio_bitrate = "128k"
+        self.voice_lufs = None
+        # Background music, looped under the video and ducked while someone speaks
+        self.music_file = None
+        self.music_lufs = -28.0
+        self.music_duck = True
+        # Where this render starts on the music (multi-segment renders continue it across segments)
+        self.music_offset = 0.0
         
-        self.has_cuda = self._check_cuda()
-        self.has_nvenc = self._check_nvenc()
+        # Encoder auto-tune: benchmark preset/CRF/tune on samples of this project against an
+        # SSIM floor (see encoder_tune.py); the chosen args override the defaults per encoder
+        self.auto_tune = False
+        self.tune_min_ssim = 0.97
+        self.tune_samples = 3
+        self.tune_sample_seconds = 2.0
+        self.encoder_profiles = {}
+        
+        # Streaming output: "hls" (MPEG-TS) or "fmp4" segments and an event playlist written next to
+        # the MP4 while it encodes (see stream_output.py); segment_callback(info) runs per finished segment
+        self.stream_output = None
+        self.stream_segment_seconds = 4.0
+        self.segment_callback = None
+        
+        # Tracing: per-stage timing of every generate_script run, written as <output>.trace.json
+        # (see render_trace.py); trace_callback(report) receives the same report when the render ends
+        self.trace_render = True
+        self.trace_callback = None
+        self._trace = None
+        
+        # Where filter scripts, cursor tracks and captions are written ("" = current directory)
+        self.work_dir = ""
+        # Transcripts computed ahead of the render (e.g. by batch Whisper workers), keyed by segment dir
+        self.transcripts = {}
+        # Optional TranscriptionWorker shared across renders, so Whisper models stay loaded
+        self.transcriber = None
+        # Receives ffmpeg_progress.Progress events (throttled) while encoding; None prints to the console
+        self.progress_callback = None
+        
+        # Probed lazily (see probe.py); assign to override
+        self._has_cuda = None
+        self._has_nvenc = None
 
-    def _check_cuda(self):
-        try:
-            import torch
-            return torch.cuda.is_available()
-        except ImportError:
-            return False
+    @property
+    def has_cuda(self):
+        # Imports torch, so only asked for when Whisper is about to run
+        if self._has_cuda is None: self._has_cuda = probe.cuda_available()
+        return self._has_cuda
 
-    def _check_nvenc(self):
-        try:
-            res = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True)
-            return "h264_nvenc" in res.stdout
-        except:
-            return False
+    @has_cuda.setter
+    def has_cuda(self, value): self._has_cuda = value
+
+    @property
+    def has_nvenc(self):
+        # A test encode passed, not just "listed by ffmpeg -encoders"
+        if self._has_nvenc is None: self._has_nvenc = probe.encoder_ok("h264_nvenc")
+        return self._has_nvenc
+
+    @has_nvenc.setter
+    def has_nvenc(self, value): self._has_nvenc = value
 
     def build_lerp_tree(self, times, values, start, end):
-        if end - start == 1:
-            t1, t2 = times[start], times[end]
-            v1, v2 = values[start], values[end]
-            if t2 == t1: return f"{v1:.2f}"
-            slope = (v2 - v1) / (t2 - t1)
-            return f"({v1:.2f}+{slope:.4f}*(t-{t1:.4f}))"
-        mid = (start + end) // 2
-        return f"if(lt(t,{times[mid]:.4f}),{self.build_lerp_tree(times, values, start, mid)},{self.build_lerp_tree(times, values, mid, end)})"
+        return lerp_tree(times, values, start, end)
 
     # Step function tree for Click Scale (instant change)
     def build_step_tree(self, times, values, start, end):
-        if start == end:
-            return f"{values[start]:.2f}"
-        mid = (start + end) // 2
-        return f"if(lt(t,{times[mid]:.4f}),{self.build_step_tree(times, values, start, mid)},{self.build_step_tree(times, values, mid+1, end)})"
+        return step_tree(times, values, start, end)
 
-    def generate_captions(self, callback=None):
+    def iter_transcript(self, callback=None, audio_path=None):
+        # Segments as they are produced (None if there is no audio or no Whisper backend)
         def log(msg):
             if callback: callback(msg)
             else: print(msg)
 
-        audio_path = os.path.join(self.segment_dir, 'audio-input.ogg')
+        audio_path = audio_path or os.path.join(self.segment_dir, 'audio-input.ogg')
         if not os.path.exists(audio_path): return None
 
-        segments_data = []
+        if self.use_faster_whisper and not backend_available("faster-whisper"):
+            log("faster-whisper not installed...")
+            self.use_faster_whisper = False
+        backend = "faster-whisper" if self.use_faster_whisper else "whisper"
+
+        cache = TranscriptionCache() if self.use_transcript_cache else None
+        def cache_key(parallel):
+            # Chunked transcripts can differ slightly at the cuts, so they are cached separately
+            return cache.key(audio_path, self.whisper_model, backend + ("+vad" if parallel else ""), self.caption_language)
+        if cache:
+            # Looked up before has_cuda, which imports torch: a parallel run may have been either kind
+            for candidate in ((True, False) if self.whisper_parallel else (False,)):
+                cached = cache.get(cache_key(candidate))
+                if cached is not None:
+                    log(f"[AI] Using cached transcript ({self.whisper_model}, {backend}, {len(cached)} lines)")
+                    return iter(cached)
+        if not backend_available(backend): return None
+        parallel = self.whisper_parallel and not self.has_cuda
+        if cache: key = cache_key(parallel)
+
         device = "cuda" if self.has_cuda else "cpu"
         compute_type = "float16" if self.has_cuda else "int8"
         log(f"[AI] Hardware Acceleration: {'ENABLED (GPU)' if self.has_cuda else 'DISABLED (CPU)'}")
-        
-        if self.use_faster_whisper:
-            try:
-                from faster_whisper import WhisperModel
-                log(f"[AI] Loading Faster-Whisper ({self.whisper_model}) on {device}...")
-                model = WhisperModel(self.whisper_model, device=device, compute_type=compute_type)
-                segments, info = model.transcribe(audio_path, language="id", beam_size=5)
-                count = 0
-                for s in segments:
-                    count += 1
-                    if count % 10 == 0: log(f"[AI] Processed {count} lines...")
-                    segments_data.append({'start': s.start, 'end': s.end, 'text': s.text})
-            except ImportError:
-                log("faster-whisper not installed...")
-                self.use_faster_whisper = False
-
-        if not self.use_faster_whisper:
-            try:
-                import whisper
-                log(f"[AI] Loading Standard Whisper ({self.whisper_model}) on {device}...")
-                model = whisper.load_model(self.whisper_model, device=device)
-                result = model.transcribe(audio_path, language="id", verbose=False)
-                segments_data = result['segments']
-            except ImportError:
-                return None
-
-        ass_path = "captions.ass"
-        srt_path = "captions.srt"
+        if parallel:
+            segments = iter(transcribe_parallel(audio_path, backend, self.whisper_model, self.caption_language,
+                                                self.whisper_workers, self.whisper_chunk_seconds, self.whisper_threads,
+                                                compute_type, log))
+        elif self.transcriber:
+            segments = self.transcriber.transcribe(audio_path, self.whisper_model, backend, self.caption_language,
+                                                   device, compute_type, log)
+        else:
+            log(f"[AI] Loading {'Faster-Whisper' if self.use_faster_whisper else 'Standard Whisper'} ({self.whisper_model}) on {device}...")
+            with self._stage("whisper.load", model=self.whisper_model, backend=backend, device=device):
+                model = load_model(backend, self.whisper_model, device, compute_type)
+            segments = run_model(model, backend, audio_path, self.caption_language)
+
+        def stream():
+            segments_data = []
+            for seg in segments:
+                segments_data.append(seg)
+                if len(segments_data) % 10 == 0: log(f"[AI] Processed {len(segments_data)} lines...")
+                yield seg
+            if cache:
+                cache.put(key, segments_data, audio=os.path.abspath(audio_path), model=self.whisper_model,
+                          backend=backend, language=self.caption_language)
+        return stream()
+
+    def transcribe(self, callback=None):
+        segments = self.iter_transcript(callback)
+        return None if segments is None else list(segments)
+
+    def transcribe_segment(self, segment_dir, callback=None):
+        sub = copy.copy(self)
+        sub.segment_dir = segment_dir
+        return sub.transcribe(callback)
+
+    def _caption_segments(self, callback=None):
+        if self.segment_dir in self.transcripts: return self.transcripts[self.segment_dir]
+        return self.iter_transcript(callback)
+
+    def write_captions(self, segments_data, ass_path=None, srt_path=None):
+        ass_path = ass_path or os.path.join(self.work_dir, "captions.ass")
+        srt_path = srt_path or os.path.join(self.work_dir, "captions.srt")
         with open(ass_path, "w", encoding="utf-8") as f_ass, open(srt_path, "w", encoding="utf-8") as f_srt:
-            f_ass.write("[Script Info]\nScriptType: v4.00+\nPlayResX: 1920\nPlayResY: 1080\n\n[V4+ Styles]\nFormat: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n")
+            # Laid out on a 1080-line script matching the canvas aspect; libass scales it to the frame
+            canvas = self.canvas()
+            f_ass.write(f"[Script Info]\nScriptType: v4.00+\nPlayResX: {round(1080 * canvas['width'] / canvas['height'])}\nPlayResY: 1080\n\n[V4+ Styles]\nFormat: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n")
             f_ass.write(f"Style: Default,{self.caption_font},{self.caption_size},{self.caption_color},{self.caption_outline_color},1,2,0,2,10,10,{self.caption_pos},1\n\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
             count = 1
             for segment in segments_data:
@@ -118,9 +276,38 @@ class VideoRenderer:
                 end_srt = self._format_srt_time(segment['end'])
                 f_srt.write(f"{count}\n{start_srt} --> {end_srt}\n{text}\n\n")
                 count += 1
+                # Segments may still be streaming in from Whisper; keep the files readable meanwhile
+                f_ass.flush(); f_srt.flush()
+        return ass_path
+
+    def generate_captions(self, callback=None):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg)
+
+        # Whisper runs lazily while the captions are written, so this stage includes transcription
+        audio_path = os.path.join(self.segment_dir, 'audio-input.ogg')
+        with self._stage("captions", audio_s=probe_duration(audio_path) if os.path.exists(audio_path) else None) as stage:
+            segments_data = self._caption_segments(callback)
+            if segments_data is None: return None
+            ass_path = self.save_captions(segments_data)
+            stage['ass_bytes'] = os.path.getsize(ass_path)
         log(f"[AI] Saved captions to {ass_path}")
         return ass_path
 
+    def save_captions(self, segments_data):
+        # ASS/SRT plus the raw segments, so multi-segment renders can merge them with time offsets.
+        # segments_data may be a live stream; ASS/SRT are written as each segment arrives.
+        collected = []
+        def keep(segments):
+            for seg in segments:
+                collected.append({'start': seg['start'], 'end': seg['end'], 'text': seg['text']})
+                yield seg
+        ass_path = self.write_captions(keep(segments_data))
+        with open(os.path.join(self.work_dir, "captions.json"), "w", encoding="utf-8") as f:
+            json.dump(collected, f)
+        return ass_path
+
     def _format_ass_time(self, seconds):
         td = float(seconds)
         h, m, s = int(td // 3600), int((td % 3600) // 60), td % 60
@@ -132,102 +319,134 @@ class VideoRenderer:
         ms = int((td - int(td)) * 1000)
         return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
 
-    def generate_script(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
-        def log(msg):
-            if callback: callback(msg)
-            else: print(msg.strip())
-
-        caption_filter = ""
-        if self.enable_caption:
-            log("[AI] Generating captions...")
-            ass_file = self.generate_captions(callback=log)
-            if ass_file:
-                escaped_ass = ass_file.replace(":", "\\:").replace("\\", "/")
-                caption_filter = f", subtitles='{escaped_ass}'"
-
+    def load_track(self, duration_limit=None, log=print):
         cursor_json_path = os.path.join(self.segment_dir, 'cursor.json')
         log(f"Loading data...")
-        with open(cursor_json_path, 'r') as f: data = json.load(f)
+        with self._stage("cursor.load", json_bytes=os.path.getsize(cursor_json_path) if os.path.exists(cursor_json_path) else None) as stage:
+            cursor = load_cursor_data(cursor_json_path, log)
+            stage.update(moves=len(cursor), clicks=len(cursor.click_times))
 
-        moves = data.get('moves', [])
-        clicks = data.get('clicks', [])
-        
-        if duration_limit: moves = [m for m in moves if m['time_ms']/1000.0 <= duration_limit + 1.0]
-        if not moves: return False
-        
-        # Sort data
-        moves.sort(key=lambda x: x['time_ms'])
+        # Arrays are time-sorted, so the duration limit is a binary search
+        n = bisect.bisect_right(cursor.times, duration_limit + 1.0) if duration_limit else len(cursor)
+        if not n: return None
         
         # Prepare Click Data
-        # We need to map clicks to a time series for scale factor
-        # Default scale = 1.0. If click down -> 0.85. If click up -> 1.0
-        # We will merge moves and clicks time points to create a continuous state
-        # But for efficiency, we can just use click events.
-        
+        # 1 while the button is down (the atlas has a pre-scaled "pressed" copy of every cursor)
         log("Processing click animation...")
-        click_events = []
+        n_clicks = bisect.bisect_right(cursor.click_times, duration_limit + 1.0) if duration_limit else len(cursor.click_times)
         # Initial state
-        click_events.append({'time': 0.0, 'scale': 1.0})
-        
-        for c in clicks:
-            t = c['time_ms'] / 1000.0
-            if duration_limit and t > duration_limit + 1.0: continue
-            
-            s = 0.85 if c['down'] else 1.0
-            click_events.append({'time': t, 'scale': s})
-            
-        click_events.sort(key=lambda x: x['time'])
+        c_times = [0.0, *cursor.click_times[:n_clicks]]
+        c_pressed = [0, *(1 if d else 0 for d in cursor.click_down[:n_clicks])]
         
-        # Build trees
-        times = [m['time_ms'] / 1000.0 for m in moves]
-        xs = [m['x'] * 1920 for m in moves]
-        ys = [m['y'] * 1080 for m in moves]
-        ids = [int(m['cursor_id']) for m in moves]
-        
-        c_times = [e['time'] for e in click_events]
-        c_scales = [e['scale'] for e in click_events]
+        # Pixel coordinates on the canvas are generated lazily; simplify_cursor reads them once
+        canvas = self.canvas()
+        if canvas['scaled']: log(f"Canvas: {canvas['width']}x{canvas['height']} (display {canvas['source'][0]}x{canvas['source'][1]} scaled to {canvas['display_w']}x{canvas['display_h']})")
+        times = cursor.times[:n]
+        xs = (canvas['x'] + x * canvas['display_w'] for x in cursor.xs[:n])
+        ys = (canvas['y'] + y * canvas['display_h'] for y in cursor.ys[:n])
+        ids = cursor.ids[:n]
 
-        log(f"Building expressions ({len(moves)} moves, {len(click_events)} clicks)...")
-        x_expr = self.build_lerp_tree(times, xs, 0, len(moves) - 1)
-        y_expr = self.build_lerp_tree(times, ys, 0, len(moves) - 1)
-        
-        # ID Tree logic (helper)
-        def build_id_tree(vals, s, e):
-            if s == e: return str(vals[s])
-            m = (s + e) // 2
-            return f"if(lt(t,{times[m]:.4f}),{build_id_tree(vals, s, m)},{build_id_tree(vals, m+1, e)})"
-        id_expr = build_id_tree(ids, 0, len(moves) - 1)
+        # Simplify before building: drops duplicate/invisible/collinear moves and merges
+        # runs of identical cursor ids and click states
+        n_moves = len(times)
+        with self._stage("cursor.simplify", moves=n_moves) as stage:
+            times, xs, ys, id_starts, id_vals = simplify_cursor(times, xs, ys, ids, self.cursor_tolerance_px)
+            c_starts, c_vals = merge_runs(c_times, c_pressed)
+            stage.update(points=len(times), id_runs=len(id_vals), click_runs=len(c_vals))
+        removed = n_moves - len(times)
+        log(f"Simplified cursor path: {n_moves} -> {len(times)} points ({removed} removed, {n_moves / len(times):.1f}x smaller), {len(id_vals)} cursor id runs")
+        return CursorTrack(times, xs, ys, id_starts, id_vals, c_starts, c_vals)
+
+    def canvas(self):
+        # Output size and where the display sits on it, from the (cached) probe of this segment's display
+        info = probe.media_info(os.path.join(self.segment_dir, 'display.mp4')) or {}
+        src_w, src_h = info.get('width') or 1920, info.get('height') or 1080
+        w, h = self.output_width, self.output_height
+        scale = min(w / src_w, h / src_h) if w and h else w / src_w if w else h / src_h if h else 1.0
+        disp_w, disp_h = (src_w, src_h) if scale == 1.0 else (_even(src_w * scale), _even(src_h * scale))
+        if not (w and h): w, h = disp_w, disp_h
+        return {'width': w, 'height': h, 'display_w': disp_w, 'display_h': disp_h, 'x': (w - disp_w) // 2, 'y': (h - disp_h) // 2,
+                'source': (src_w, src_h), 'scaled': (disp_w, disp_h, w, h) != (src_w, src_h, src_w, src_h)}
+
+    def _track_fps(self):
+        # A track slower than the output makes the cursor judder on 60 fps recordings
+        if self.track_fps: return self.track_fps
+        if self.output_fps: return self.output_fps
+        info = probe.media_info(os.path.join(self.segment_dir, 'display.mp4')) or {}
+        return round(info.get('fps') or 30, 3)
+
+    def _px(self, value):
+        # A size given for a 1080p canvas, on this canvas
+        return max(1, round(value * self.canvas()['height'] / 1080))
+
+    def _inputs(self, start=None, duration=None):
+        # Pre-input seeking: only the window is decoded
+        seek = []
+        if start: seek.extend(['-ss', f"{start:.3f}"])
+        if duration: seek.extend(['-t', f"{duration:.3f}"])
+        inputs = [*seek, '-i', os.path.join(self.segment_dir, 'display.mp4'), *seek, '-i', os.path.join(self.segment_dir, 'camera.mp4'), *seek, '-i', os.path.join(self.segment_dir, 'audio-input.ogg')]
+        # Input 3: the cursor atlas, repeated at the track rate so the crop can change every frame
+        inputs.extend(['-loop', '1', '-framerate', f"{self._track_fps():g}", '-i', self.cursor_atlas()])
+        # Input 4: static camera mask (one frame; alphamerge repeats it)
+        mask = self.camera_mask()
+        if mask: inputs.extend(['-i', mask])
+        return inputs
+
+    def cursor_atlas(self):
+        # Built once per size and cached; the stage shows when that happened during a render
+        size = self._px(self.cursor_scale)
+        return cursor_atlas_path(self.cursor_dir, size, self.click_scale, stage=lambda: self._stage("cursor.atlas", size=size))
+
+    def camera_mask(self):
+        if self.cam_shape not in ("circle", "rounded"): return None
+        return camera_mask_path(self.cam_shape, self._px(self.cam_scale_w), self._px(self.cam_scale_h), self._px(self.cam_radius), self.cam_feather)
+
+    def write_filter_script(self, filter_file, track_file, track, duration, caption_file=None, log=print):
+        # Expression trees (or the sendcmd track) are built as the script is written, so this is one stage
+        with self._stage("filter_script", mode=self.cursor_mode, moves=len(track.times), seconds=round(duration, 3)) as stage:
+            self._write_filter_script(filter_file, track_file, track, duration, caption_file, log)
+            stage['script_bytes'] = os.path.getsize(filter_file)
+            if self.cursor_mode == "sendcmd": stage['track_bytes'] = os.path.getsize(track_file)
+
+    def _write_filter_script(self, filter_file, track_file, track, duration, caption_file=None, log=print):
+        caption_filter = f", subtitles='{_filter_path(caption_file)}'" if caption_file else ""
+        canvas, c_size = self.canvas(), self._px(self.cursor_scale)
+        times, xs, ys = track.times, track.xs, track.ys
+        id_starts, id_vals, c_starts, c_vals = track.id_starts, track.id_vals, track.c_starts, track.c_vals
+
+        if self.cursor_mode == "sendcmd":
+            log(f"Resampling cursor track at {self._track_fps():g} fps ({len(times)} moves, {len(c_vals)} clicks)...")
+            n_cmds = write_sendcmd_track(track_file, self._track_fps(), duration, times, xs, ys, id_starts, id_vals, c_starts, c_vals, c_size)
+            log(f"Cursor track: {n_cmds} commands")
+        else:
+            log(f"Building expressions ({len(times)} moves, {len(c_vals)} clicks)...")
+            # Expressions are streamed into the filter script when it is written below
+            x_expr = lambda out: write_lerp_tree(out, times, xs, 0, len(times) - 1)
+            y_expr = lambda out: write_lerp_tree(out, times, ys, 0, len(times) - 1)
         
-        # Scale Tree logic (helper using click times)
-        def build_scale_tree(vals, s, e):
-            if s == e: return str(vals[s])
-            m = (s + e) // 2
-            return f"if(lt(t,{c_times[m]:.4f}),{build_scale_tree(vals, s, m)},{build_scale_tree(vals, m+1, e)})"
+            # ID Tree: run i starts at id_starts[i], so it branches on the next start
+            id_expr = lambda out: write_step_tree(out, id_starts[1:], id_vals, 0, len(id_vals) - 1, str)
         
-        if len(click_events) > 0:
-            scale_expr = build_scale_tree(c_scales, 0, len(click_events)-1)
-        else:
-            scale_expr = "1.0"
-
-        inputs = ['-i', os.path.join(self.segment_dir, 'display.mp4'), '-i', os.path.join(self.segment_dir, 'camera.mp4'), '-i', os.path.join(self.segment_dir, 'audio-input.ogg')]
-        for i in range(11): inputs.extend(['-i', os.path.join(self.cursor_dir, f'cursor_{i}.png')])
+            # Pressed Tree (click run starts): selects the pressed half of the atlas
+            if len(c_vals) > 0:
+                pressed_expr = lambda out: write_step_tree(out, c_starts[1:], c_vals, 0, len(c_vals) - 1, str)
+            else:
+                pressed_expr = "0"
 
         filters = []
         
         # --- 1. Camera Processing (Clean, No Shadow) ---
-        filters.append(f"[1:v] scale={self.cam_scale_w}:{self.cam_scale_h}, format=rgba [cam_scaled];")
+        filters.append(f"[1:v] scale={self._px(self.cam_scale_w)}:{self._px(self.cam_scale_h)}, format=rgba [cam_scaled];")
         
-        if self.cam_shape == "circle":
-            r = min(self.cam_scale_w, self.cam_scale_h) / 2
-            filters.append(f"[cam_scaled] geq=lum='p(X,Y)':a='if(lte(pow(X-{self.cam_scale_w/2},2)+pow(Y-{self.cam_scale_h/2},2),{r*r}),255,0)' [cam_out];")
-        elif self.cam_shape == "rounded":
-            rad = 20
-            filters.append(f"[cam_scaled] geq=lum='p(X,Y)':a='if(lte(pow(max(0,abs(X-{self.cam_scale_w/2})-{self.cam_scale_w/2-rad}),2)+pow(max(0,abs(Y-{self.cam_scale_h/2})-{self.cam_scale_h/2-rad}),2),{rad*rad}),255,0)' [cam_out];")
+        if self.cam_shape in ("circle", "rounded"):
+            # The mask is precomputed (see camera_mask_path); per frame this is only a plane copy
+            filters.append("[4:v] format=gray [cam_mask];")
+            filters.append("[cam_scaled][cam_mask] alphamerge [cam_out];")
         else:
             filters.append("[cam_scaled] copy [cam_out];")
 
         # --- 2. Camera Overlay ---
-        margin_x, margin_y = self.cam_margin_x, self.cam_margin_y
+        margin_x, margin_y = self._px(self.cam_margin_x), self._px(self.cam_margin_y)
         if "Top-Left" in self.cam_position: cam_x, cam_y = f"{margin_x}", f"{margin_y}"
         elif "Top-Right" in self.cam_position: cam_x, cam_y = f"W-w-{margin_x}", f"{margin_y}"
         elif "Bottom-Left" in self.cam_position: cam_x, cam_y = f"{margin_x}", f"H-h-{margin_y}"
@@ -236,73 +455,935 @@ class VideoRenderer:
         elif "Bottom-Center" in self.cam_position: cam_x, cam_y = f"(W-w)/2", f"H-h-{margin_y}"
         else: cam_x, cam_y = f"W-w-{margin_x}", f"{margin_y}"
 
-        filters.append(f"[0:v][cam_out] overlay={cam_x}:{cam_y} [bg];")
+        # The display is brought to the output rate and size first, so everything after runs on the canvas
+        display = [f"fps={self.output_fps:g}"] if self.output_fps else []
+        if (canvas['display_w'], canvas['display_h']) != canvas['source']:
+            display.append(f"scale={canvas['display_w']}:{canvas['display_h']}")
+        if (canvas['display_w'], canvas['display_h']) != (canvas['width'], canvas['height']):
+            display.append(f"pad={canvas['width']}:{canvas['height']}:{canvas['x']}:{canvas['y']}")
+        if self.cursor_mode == "sendcmd": display.append(f"sendcmd=f='{_filter_path(track_file)}'")
+        if display:
+            filters.append(f"[0:v] {', '.join(display)} [disp];")
+            filters.append(f"[disp][cam_out] overlay={cam_x}:{cam_y} [bg];")
+        else:
+            filters.append(f"[0:v][cam_out] overlay={cam_x}:{cam_y} [bg];")
         
         # --- 3. Cursor Processing (Clean, Click Animation) ---
-        c_size = self.cursor_scale
-        cursor_pads = []
-        for i in range(11):
-            # Scale only, no shadow.
-            filters.append(f"[{i+3}:v] scale={c_size}:{c_size}:force_original_aspect_ratio=decrease, pad={c_size}:{c_size}:(ow-iw)/2:(oh-ih)/2:color=black@0 [c{i}];")
-            cursor_pads.append(f"[c{i}]")
-        
-        filters.append(f"{''.join(cursor_pads)} vstack=inputs=11 [atlas];")
-        filters.append(f"[atlas] crop={c_size}:{c_size}:0:'({id_expr})*{c_size}' [cursor_raw];")
-        
-        # Apply Click Scale Animation
-        # We use 'scale' filter with eval=frame to dynamically resize the cursor based on time
-        # Note: Dynamic scaling in filter_complex can be heavy.
-        # Alternative: Scale the atlas or the cropped stream.
-        # Ideally: [cursor_raw] scale=w='iw*scale_expr':h='ih*scale_expr':eval=frame [cursor_scaled]
-        # But scale filter dynamic expression often requires w/h to be even numbers and can be tricky.
-        # Let's try simpler approach: we already have pads.
-        # Actually, simpler visual trick: We can't easily resize the stream constantly without re-padding.
-        # Let's Skip dynamic scaling in FFmpeg for now as it might break 'overlay' if dimensions change frame-by-frame without complex padding logic.
-        # Instead, we will simulate click by changing the 'overlay' expression? No overlay doesn't scale.
-        # Okay, let's try the 'scale' filter on the cropped cursor.
-        # We must pad it back to c_size to avoid overlay coordinate shifting errors.
-        
-        filters.append(f"[cursor_raw] scale=w='iw*({scale_expr})':h='ih*({scale_expr})':eval=frame, pad={c_size}:{c_size}:(ow-iw)/2:(oh-ih)/2:color=black@0:eval=frame [cursor];")
-        
-        filters.append(f"[bg][cursor] overlay=x='{x_expr}':y='{y_expr}':eval=frame{caption_filter} [outv];")
+        # The atlas is prebuilt (see cursor_atlas_path): cursor i at row i, its pressed copy at
+        # row i+11, so cursor changes and clicks are both just a crop offset.
+        filters.append("[3:v] format=rgba [atlas];")
+        if self.cursor_mode == "sendcmd":
+            filters.append(f"[atlas] crop@atlas=w={c_size}:h={c_size}:x=0:y=0 [cursor];")
+            filters.append(f"[bg][cursor] overlay@cursor=x=0:y=0:eval=init:shortest=1{caption_filter} [outv];")
+        else:
+            filters.append([f"[atlas] crop={c_size}:{c_size}:0:'((", id_expr, ")+11*(", pressed_expr, f"))*{c_size}' [cursor];"])
+            filters.append(["[bg][cursor] overlay=x='", x_expr, "':y='", y_expr, f"':eval=frame:shortest=1{caption_filter} [outv];"])
         
-        filter_file = "filter_script_v2.txt"
-        with open(filter_file, 'w', encoding="utf-8") as f: f.write("\n".join(filters))
+        with open(filter_file, 'w', encoding="utf-8") as f: _write_filter_lines(f, filters)
 
-        if use_hevc: v_codec, desc = ("hevc_nvenc" if self.has_nvenc else "libx265"), "H.265"
-        else: v_codec, desc = ("h264_nvenc" if self.has_nvenc else "libx264"), "H.264"
+    def _pick_codec(self, use_hevc, log=print):
+        # Chosen from the probe's test encodes, so a broken NVENC never starts a full-length run
+        with self._stage("encoder.probe"):
+            if self._has_nvenc is False: v_codec = "libx265" if use_hevc else "libx264"
+            else: v_codec = probe.pick_encoder(use_hevc) or ("libx265" if use_hevc else "libx264")
+        if use_hevc and "265" not in v_codec and "hevc" not in v_codec: log("[WARN] No working H.265 encoder, using H.264")
+        desc = "H.264" if "264" in v_codec else "H.265"
         log(f"[Render] Encoder: {v_codec} ({desc}) [{'GPU' if 'nvenc' in v_codec else 'CPU'}]")
+        return v_codec
+
+    def _fallback_codec(self, v_codec):
+        # CPU encoder a failed GPU encode is redone with, matching the format actually picked
+        return probe.cpu_encoder(v_codec) if "nvenc" in v_codec else v_codec
+
+    def _codec_args(self, v_codec):
+        if v_codec in self.encoder_profiles: return ['-c:v', v_codec, *self.encoder_profiles[v_codec]]
+        if "nvenc" in v_codec: return ['-c:v', v_codec, '-preset', 'p4', '-cq', '23']
+        return ['-c:v', v_codec, '-preset', 'veryfast', '-crf', '23']
+
+    def tune_encoder(self, v_codec, log=print, refresh=False):
+        # Picks codec args for v_codec from lossless samples of the composited output; the
+        # benchmark itself is cached, only the short samples are rendered every time
+        if v_codec in self.encoder_profiles and not refresh: return self.encoder_profiles[v_codec]
+        quiet = lambda msg: None
+        track = self.load_track(None, quiet)
+        if track is None: return None
+        total = probe_duration(os.path.join(self.segment_dir, 'display.mp4')) or track.times[-1]
+        starts, length = sample_windows(total, self.tune_samples, self.tune_sample_seconds)
+        work_dir = tempfile.mkdtemp(prefix="capso-tune-")
+        try:
+            samples = []
+            for j, start in enumerate(starts):
+                prefix = os.path.join(work_dir, f"sample_{j:02d}")
+                self._write_window(prefix, track, None, start, start + length)
+                cmd = ['ffmpeg', '-y', *self._inputs(start, length), '-/filter_complex', prefix + ".txt", '-map', '[outv]', '-an',
+                       '-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0', '-t', f"{length:.3f}", prefix + ".mkv"]
+                returncode, output_log = self._run_ffmpeg(cmd, show_progress=False, stage="ffmpeg.tune_sample", sample=j)
+                if returncode != 0:
+                    log("[WARN] Tuning sample failed, keeping default encoder settings:\n" + "".join(output_log[-10:]))
+                    return None
+                samples.append(prefix + ".mkv")
+            with self._stage("encoder.tune", encoder=v_codec, samples=len(samples)):
+                profile = encoder_tune.tune(v_codec, samples, self.tune_min_ssim, log, refresh)
+        except RuntimeError as e:
+            log(f"[WARN] Encoder tuning failed ({e}), keeping default settings")
+            return None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if profile: self.encoder_profiles[v_codec] = profile['args']
+        return self.encoder_profiles.get(v_codec)
+
+    def final_audio(self, ranges=None, limit=None, log=print):
+        # Cached final audio track (see audio_mix.py), or None to encode the audio inline
+        voice = os.path.join(self.segment_dir, 'audio-input.ogg')
+        if not (self.cache_audio or self.music_file) or not os.path.exists(voice): return None
+        try:
+            with self._stage("audio", audio_s=ranges_length(ranges) if ranges else limit or probe_duration(voice), music=bool(self.music_file)):
+                return audio_mix.final_audio(voice, ranges, limit, self.music_file, self.music_offset, self.voice_lufs,
+                                             self.music_lufs, self.music_duck, self.audio_bitrate, log=log)
+        except RuntimeError as e:
+            log(f"[WARN] Audio pre-encode failed ({e}), encoding audio inline")
+            return None
 
-        cmd = ['ffmpeg', '-y', *inputs, '-/filter_complex', filter_file, '-map', '[outv]', '-map', '2:a', '-c:v', v_codec, '-c:a', 'aac', '-b:a', '128k']
-        if "nvenc" in v_codec: cmd.extend(['-preset', 'p4', '-cq', '23'])
-        else: cmd.extend(['-preset', 'veryfast', '-crf', '23'])
+    def _render_cmd(self, inputs, filter_file, codec, output_file, duration_limit=None, audio_file=None):
+        # audio_file: a finished track to stream-copy instead of encoding input 2
+        audio = ['-map', '2:a', '-c:a', 'aac', '-b:a', self.audio_bitrate]
+        if audio_file:
+            audio = ['-map', f"{inputs.count('-i')}:a", '-c:a', 'copy']
+            inputs = [*inputs, '-i', audio_file]
+        cmd = ['ffmpeg', '-y', *inputs, '-/filter_complex', filter_file, '-map', '[outv]', *self._codec_args(codec), *audio]
         if duration_limit: cmd.extend(['-t', str(duration_limit)])
-        cmd.append(output_file)
+        if self.stream_output:
+            # Keyframes on the segment grid, and codec headers the MP4 leg of the tee can use
+            cmd.extend(['-flags', '+global_header', '-force_key_frames', f"expr:gte(t,n_forced*{self.stream_segment_seconds:g})"])
+        cmd.extend(self._output_args(output_file))
+        return cmd
+
+    def _output_args(self, output_file):
+        if not self.stream_output: return [output_file]
+        return stream_output.output_args(output_file, self.stream_output, self.stream_segment_seconds)
+
+    def _stream_watch(self, output_file, log):
+        # Reports finished segments while ffmpeg writes them (nothing to do without streaming output)
+        if not self.stream_output: return contextlib.nullcontext()
+        stream_output.reset(output_file)
+        log(f"[Stream] Writing {self.stream_output} segments to {stream_output.playlist_path(output_file)}")
+        return stream_output.SegmentWatcher(stream_output.playlist_path(output_file), self.segment_callback or (lambda info: None))
+
+    def _progress_sink(self):
+        return self.progress_callback or (lambda p: print(str(p), end='\r'))
+
+    def _run_ffmpeg(self, cmd, show_progress=True, total=None, on_progress=None, stage=None, **fields):
+        # Returns (returncode, last stderr lines); on_progress overrides the renderer-wide sink.
+        # With a stage name the run's timing goes into the trace (fields are added to its record)
+        if on_progress is None and show_progress: on_progress = self._progress_sink()
+        stats = {} if stage and self._trace else None
+        returncode, output_log = run_ffmpeg(cmd, total, on_progress, stats=stats)
+        if stats is not None: self._trace.ffmpeg(stage, stats, **fields)
+        return returncode, output_log
+
+    def _stage(self, name, **sizes):
+        # Timed block of the current trace; yields a dict for sizes (a throwaway one when not tracing)
+        if self._trace: return self._trace.stage(name, **sizes)
+        return contextlib.nullcontext({})
+
+    def generate_script(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
+        # Traced render: sub-renders (segments) add to the caller's trace, the outermost one writes the report
+        if self._trace is not None or not self.trace_render: return self._generate_script(output_file, duration_limit, callback, use_hevc)
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        self._trace = render_trace.RenderTrace(project=os.path.abspath(self.project_dir), output=os.path.abspath(output_file),
+                                               duration_limit=duration_limit, segments=len(self.segment_dirs))
+        ok = False
+        try:
+            ok = self._generate_script(output_file, duration_limit, callback, use_hevc)
+            return ok
+        finally:
+            trace, self._trace = self._trace, None
+            report = trace.report(ok=bool(ok))
+            path = render_trace.report_path(output_file)
+            try:
+                render_trace.write_report(report, path)
+                log(f"[Trace] {render_trace.summary(report)} ({path})")
+            except OSError as e:
+                log(f"[WARN] Could not write the trace report: {e}")
+            if self.trace_callback: self.trace_callback(report)
+
+    def _generate_script(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        if len(self.segment_dirs) > 1: return self.generate_segments(output_file, duration_limit, callback, use_hevc)
+        if self.renditions: return self.generate_renditions(output_file, duration_limit, callback, use_hevc)
+        if self.chunked or self.incremental or self.keep_ranges or self.jump_cuts: return self.generate_chunked(output_file, duration_limit, callback, use_hevc)
+
+        caption_file = None
+        if self.enable_caption:
+            log("[AI] Generating captions...")
+            caption_file = self.generate_captions(callback=log)
+
+        track = self.load_track(duration_limit, log)
+        if track is None: return False
+
+        filter_file = os.path.join(self.work_dir, "filter_script_v2.txt")
+        duration = duration_limit if duration_limit else track.times[-1]
+        self.write_filter_script(filter_file, os.path.join(self.work_dir, "cursor_track.cmd"), track, duration, caption_file, log)
+
+        inputs = self._inputs()
+        v_codec = self._pick_codec(use_hevc, log)
+        if self.auto_tune: self.tune_encoder(v_codec, log)
+
+        audio_file = self.final_audio(None, duration_limit, log)
+        def build_cmd(codec): return self._render_cmd(inputs, filter_file, codec, output_file, duration_limit, audio_file)
         
+        # ETA is measured against the real output length, not the last cursor event
+        total = duration_limit or probe_duration(os.path.join(self.segment_dir, 'display.mp4')) or duration
         log(f"Starting Render...")
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, universal_newlines=True)
-        output_log = []
-        for line in process.stdout:
-            output_log.append(line)
-            if "frame=" in line: print(line.strip(), end='\r')
-        process.wait()
+        with self._stream_watch(output_file, log):
+            returncode, output_log = self._run_ffmpeg(build_cmd(v_codec), total=total, stage="ffmpeg.encode", codec=v_codec)
         
-        if process.returncode != 0:
+        if returncode != 0:
             if "nvenc" in v_codec:
                 log(f"\n[WARN] GPU failed. Fallback to CPU...")
-                fallback_codec = "libx265" if use_hevc else "libx264"
-                cmd = ['ffmpeg', '-y', *inputs, '-/filter_complex', filter_file, '-map', '[outv]', '-map', '2:a', '-c:v', fallback_codec, '-preset', 'veryfast', '-crf', '23', '-c:a', 'aac', '-b:a', '128k']
+                fallback_codec = self._fallback_codec(v_codec)
+                # Segments restart from the first one; an uploader sees the same names again
+                with self._stream_watch(output_file, log):
+                    returncode, _ = self._run_ffmpeg(build_cmd(fallback_codec), total=total, stage="ffmpeg.encode", codec=fallback_codec)
+                if returncode == 0: return True
+            log("\nError Output:\n" + "".join(output_log[-20:]))
+            return False
+        return True
+
+    # --- Renditions ---
+    # One decode and one composite, split inside the graph into several outputs, each with its
+    # own crop, scale and encoder settings, all encoded in the same ffmpeg run.
+
+    def output_paths(self, output_file):
+        # Files a render to output_file produces
+        if not self.renditions: return [output_file]
+        return [rendition_path(output_file, r['name']) for r in self._renditions()]
+
+    def _renditions(self):
+        out = []
+        for r in self.renditions or []:
+            if isinstance(r, str): r = {'name': r}
+            out.append({**RENDITIONS.get(r['name'], {}), **r})
+        return out
+
+    def _rendition_filters(self, renditions, track, duration):
+        # Filter lines from [outv] to [r0], [r1], ...
+        labels = "".join(f"[rend{i}]" for i in range(len(renditions)))
+        lines = [f"[outv] split={len(renditions)} {labels};" if len(renditions) > 1 else "[outv] copy [rend0];"]
+        for i, r in enumerate(renditions):
+            chain = []
+            if r.get('aspect'):
+                a, b = r['aspect']
+                x = "(iw-ow)/2"
+                if r.get('follow_cursor') and track is not None:
+                    # Crop centre follows a smoothed cursor x path (canvas pixels)
+                    ts, vs = smooth_path(track.times, track.xs, duration)
+                    x = ["clip((", lambda out, ts=ts, vs=vs: write_lerp_tree(out, ts, vs, 0, len(ts) - 1), ")-ow/2,0,iw-ow)"]
+                chain.append(["crop=w='trunc(min(iw,ih*", f"{a}/{b}", ")/2)*2':h='trunc(min(ih,iw*", f"{b}/{a}", ")/2)*2':x='",
+                              *([x] if isinstance(x, str) else x), "':y='(ih-oh)/2'"])
+            w, h = r.get('width'), r.get('height')
+            if w and h: chain.append(f"scale={w}:{h}:force_original_aspect_ratio=decrease, pad={w}:{h}:(ow-iw)/2:(oh-ih)/2, setsar=1")
+            elif w or h: chain.append(f"scale={w or -2}:{h or -2}")
+            if not chain: chain.append("copy")
+            line = [f"[rend{i}] "]
+            for j, part in enumerate(chain):
+                if j: line.append(", ")
+                line.extend([part] if isinstance(part, str) else part)
+            line.append(f" [r{i}];")
+            lines.append(line)
+        return lines
+
+    def _rendition_codec_args(self, r, codec):
+        args = self._codec_args(codec)
+        if r.get('crf') is not None:
+            for flag in ('-crf', '-cq'):
+                if flag in args: args[args.index(flag) + 1] = str(r['crf'])
+        if r.get('bitrate'): args.extend(['-maxrate', r['bitrate'], '-bufsize', r['bitrate']])
+        return args
+
+    def generate_renditions(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        if self.chunked or self.incremental or self.keep_ranges or self.jump_cuts:
+            log("[WARN] Renditions are rendered in a single pass; chunked, incremental, trim and jump-cut settings are not applied")
+        if self.stream_output: log("[WARN] Streaming output is not written for renditions; each one is a plain MP4")
+        renditions = self._renditions()
+        paths = self.output_paths(output_file)
+        log(f"[Renditions] {', '.join(r['name'] for r in renditions)} from one decode")
+
+        caption_file = None
+        if self.enable_caption:
+            log("[AI] Generating captions...")
+            caption_file = self.generate_captions(callback=log)
+
+        track = self.load_track(duration_limit, log)
+        if track is None: return False
+        filter_file = os.path.join(self.work_dir, "filter_script_v2.txt")
+        duration = duration_limit if duration_limit else track.times[-1]
+        self.write_filter_script(filter_file, os.path.join(self.work_dir, "cursor_track.cmd"), track, duration, caption_file, log)
+        with open(filter_file, 'a', encoding="utf-8") as f:
+            f.write("\n")
+            _write_filter_lines(f, self._rendition_filters(renditions, track, duration))
+
+        inputs = self._inputs()
+        v_codec = self._pick_codec(use_hevc, log)
+        if self.auto_tune: self.tune_encoder(v_codec, log)
+        audio_file = self.final_audio(None, duration_limit, log)
+        audio = ['-map', '2:a', '-c:a', 'aac', '-b:a', self.audio_bitrate]
+        if audio_file: audio = ['-map', f"{inputs.count('-i')}:a", '-c:a', 'copy']
+
+        def build_cmd(codec):
+            cmd = ['ffmpeg', '-y', *inputs, *(['-i', audio_file] if audio_file else []), '-/filter_complex', filter_file]
+            for i, (r, path) in enumerate(zip(renditions, paths)):
+                cmd.extend(['-map', f"[r{i}]", *self._rendition_codec_args(r, r.get('codec') or codec), *audio])
                 if duration_limit: cmd.extend(['-t', str(duration_limit)])
-                cmd.append(output_file)
-                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, universal_newlines=True)
-                for line in process.stdout:
-                    if "frame=" in line: print(line.strip(), end='\r')
-                process.wait()
-                if process.returncode == 0: return True
-            print("\nError Output:"); print("".join(output_log[-20:]))
+                cmd.append(path)
+            return cmd
+
+        total = duration_limit or probe_duration(os.path.join(self.segment_dir, 'display.mp4')) or duration
+        log(f"Starting Render...")
+        returncode, output_log = self._run_ffmpeg(build_cmd(v_codec), total=total, stage="ffmpeg.encode", codec=v_codec, renditions=len(renditions))
+        if returncode != 0 and "nvenc" in v_codec:
+            log(f"\n[WARN] GPU failed. Fallback to CPU...")
+            fallback_codec = self._fallback_codec(v_codec)
+            returncode, output_log = self._run_ffmpeg(build_cmd(fallback_codec), total=total, stage="ffmpeg.encode", codec=fallback_codec, renditions=len(renditions))
+        if returncode != 0:
+            log("\nError Output:\n" + "".join(output_log[-20:]))
+            return False
+        return True
+
+    # --- Chunked Rendering ---
+    # The timeline is split into GOP-aligned windows rendered by parallel ffmpeg processes
+    # (video only, inputs seeked to the window, tracks rebased), then joined losslessly with
+    # the concat demuxer while the audio is encoded once for the whole timeline.
+
+    def _chunk_plan(self, total, codec=None):
+        # -> (windows, workers, threads); the windows don't depend on codec, so a fallback pass
+        # re-encodes exactly the same chunks
+        cpus = os.cpu_count() or 2
+        # Each x264/x265 encoder already scales across a few threads on its own
+        workers = self.chunk_workers or max(1, cpus // 4)
+        count = self.chunk_count or workers * 2
+        gop = self.chunk_gop_seconds
+        length = max(gop, math.ceil(total / count / gop) * gop)
+        # Cached chunks are only reusable if the boundaries never move
+        if self.incremental: length = max(gop, math.ceil(self.incremental_chunk_seconds / gop) * gop)
+        windows = []
+        t = 0.0
+        while t < total:
+            windows.append((t, min(t + length, total)))
+            t += length
+        # Encodes past the driver's NVENC session cap would fail outright
+        if codec and "nvenc" in codec: workers = min(workers, max(1, self.nvenc_sessions))
+        return windows, workers, max(1, cpus // workers)
+
+    def generate_chunked(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        # Chunks are encoded out of order and the audio only at the join, so nothing streams before it
+        if self.stream_output: log("[WARN] Streaming output of a chunked, trimmed or jump-cut render starts only when all chunks are joined")
+        work_dir = os.path.splitext(output_file)[0] + "_chunks"
+        os.makedirs(work_dir, exist_ok=True)
+        display = os.path.join(self.segment_dir, 'display.mp4')
+
+        # With keep_ranges / jump-cuts the output timeline is the ranges back to back (sped-up
+        # ones shortened); duration_limit caps its length
+        track, ranges = None, None
+        if self.keep_ranges or self.jump_cuts:
+            source = probe_duration(display)
+            if source is None:
+                track = self.load_track(None, log)
+                if track is None: return False
+                source = track.times[-1]
+            ranges = normalize_ranges(self.keep_ranges or [(0.0, source)], source)
+            if self.keep_ranges: log(f"[Trim] {len(ranges)} ranges, {format_seconds(ranges_length(ranges))} of {format_seconds(source)} kept")
+            if self.jump_cuts: ranges = self._jump_cut(ranges, log)
+            ranges = normalize_ranges(ranges, source, duration_limit)
+            if not ranges:
+                log("[Trim] Nothing left to render in the selected ranges")
+                return False
+        # Ranges keep the order given, so the latest source time isn't necessarily the last range's end
+        track = track or self.load_track(max(end for _, end, _ in ranges) if ranges else duration_limit, log)
+        if track is None: return False
+        total = ranges_length(ranges) if ranges else duration_limit or probe_duration(display) or track.times[-1]
+
+        # Caption segments are on the output timeline
+        segments = None
+        if self.enable_caption:
+            log("[AI] Generating captions...")
+            segments = self._trim_captions(ranges, work_dir, log) if ranges else self._caption_segments(callback=log)
+            # Every chunk needs its own slice of the transcript, so wait for all of it here
+            if segments is not None:
+                segments = list(segments)
+                self.save_captions(segments)
+
+        v_codec = self._pick_codec(use_hevc, log)
+        if self.auto_tune: self.tune_encoder(v_codec, log)
+        fallback_codec = self._fallback_codec(v_codec)
+        windows, workers, threads = self._chunk_plan(total, v_codec)
+        # (source start, source end, output start, speed); a chunk never spans a cut
+        pieces = split_ranges(ranges, windows[0][1]) if ranges else [(start, end, start, 1.0) for start, end in windows]
+        log(f"[Chunked] {len(pieces)} chunks of {windows[0][1]:.1f}s on {workers} workers ({threads} threads each)")
+
+        cache = ChunkCache(max_bytes=self.chunk_cache_bytes) if self.incremental else None
+        jobs = []
+        for i, (start, end, out_start, speed) in enumerate(pieces):
+            prefix = os.path.join(work_dir, f"chunk_{i:04d}")
+            self._write_window(prefix, track, segments, start, end, caption_start=out_start, speed=speed)
+            keys = {codec: self._chunk_key(cache, prefix, start, end, codec) for codec in (v_codec, fallback_codec)} if cache else {}
+            jobs.append((i, start, end, speed, prefix, keys))
+
+        def render_chunk(job, codec, threads):
+            i, start, end, speed, prefix, keys = job
+            length = (end - start) / speed
+            if cache:
+                cached = cache.get(keys[codec])
+                if cached:
+                    tracker.update(i, Progress(out_time=length, done=True))
+                    return cached
+            out = cache.partial(keys[codec]) if cache else prefix + ".mp4"
+            cmd = ['ffmpeg', '-y', *self._inputs(start, end - start), '-/filter_complex', prefix + ".txt", '-map', '[outv]' if speed == 1 else '[sped]', '-an',
+                   *self._codec_args(codec), '-force_key_frames', f"expr:gte(t,n_forced*{self.chunk_gop_seconds})"]
+            if "nvenc" not in codec: cmd.extend(['-threads', str(threads)])
+            cmd.extend(['-t', f"{length:.3f}", out])
+            returncode, output_log = self._run_ffmpeg(cmd, show_progress=False, on_progress=lambda p: tracker.update(i, p),
+                                                      stage="ffmpeg.chunk", chunk=i, codec=codec)
+            if returncode == 0:
+                log(f"[Chunked] Chunk {i + 1}/{len(jobs)} done ({start:.1f}s - {end:.1f}s)")
+                return cache.commit(keys[codec]) if cache else out
+            log(f"[WARN] Chunk {i + 1} failed with {codec}:\n" + "".join(output_log[-10:]))
+            return None
+
+        def render_pass(codec):
+            # Every chunk with one encoder: the join is a stream copy, so mixing encoders
+            # (different SPS/PPS and profiles) would break the output
+            _, pass_workers, pass_threads = self._chunk_plan(total, codec)
+            with ThreadPoolExecutor(max_workers=pass_workers) as pool:
+                return list(pool.map(lambda job: render_chunk(job, codec, pass_threads), jobs))
+
+        codecs = [v_codec, fallback_codec] if "nvenc" in v_codec else [v_codec]
+        if cache:
+            cache.save_index()
+            # A previous run that had to fall back left its chunks under the fallback key
+            if "nvenc" in v_codec and all(cache.get(keys[fallback_codec]) for *_, keys in jobs) and not all(cache.get(keys[v_codec]) for *_, keys in jobs):
+                codecs = [fallback_codec]
+            reused = sum(1 for *_, keys in jobs if cache.get(keys[codecs[0]]))
+            log(f"[Incremental] {len(jobs) - reused} of {len(jobs)} chunks to encode, {reused} reused from cache")
+        log(f"Starting Render...")
+        tracker = ProgressTracker(total, self._progress_sink())
+        for n, codec in enumerate(codecs):
+            if n: log(f"[WARN] GPU encode failed, re-encoding all {len(jobs)} chunks with {codec}...")
+            results = render_pass(codec)
+            if all(results): break
+        if not all(results): return False
+        tracker.finish()
+
+        list_file = os.path.join(work_dir, "concat.txt")
+        with open(list_file, 'w', encoding="utf-8") as f:
+            for path in results: f.write(f"file '{os.path.abspath(path).replace(os.sep, '/')}'\n")
+        audio_file = self.final_audio(ranges, None if ranges else duration_limit, log)
+        if audio_file:
+            log("[Chunked] Joining chunks...")
+            audio_inputs, audio_map, audio_codec = ['-i', audio_file], ['-map', '1:a'], ['-c:a', 'copy']
+        else:
+            log("[Chunked] Joining chunks and encoding audio...")
+            (audio_inputs, audio_map), audio_codec = self._range_audio(ranges, 1), ['-c:a', 'aac', '-b:a', self.audio_bitrate]
+        # Streaming output is cut from the joined chunks (GOP-aligned, so segments still split at keyframes)
+        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_file, *audio_inputs,
+               '-map', '0:v', *audio_map, '-c:v', 'copy', *audio_codec, '-t', f"{total:.3f}", *self._output_args(output_file)]
+        with self._stream_watch(output_file, log):
+            returncode, output_log = self._run_ffmpeg(cmd, show_progress=False, stage="ffmpeg.join", chunks=len(results))
+        if returncode != 0:
+            log("\nError Output:\n" + "".join(output_log[-20:]))
             return False
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if cache:
+            removed = cache.prune()
+            if removed: log(f"[Incremental] Pruned {removed} old chunks from the cache")
         return True
 
+    def _write_window(self, prefix, track, segments, start, end, caption_start=None, speed=1.0):
+        # Filter script (+ cursor track, captions) for [start, end) rebased to t=0, as <prefix>.*
+        # caption_start is where the window begins on the captions' timeline (default: start);
+        # speed != 1 adds [sped]
+        caption_file = None
+        if segments:
+            caption_start = start if caption_start is None else caption_start
+            # Captions are burned in before the speed-up, so they are laid out in source time
+            window = rebase_segments(segments, caption_start, caption_start + (end - start) / speed)
+            window = [{'start': seg['start'] * speed, 'end': seg['end'] * speed, 'text': seg['text']} for seg in window]
+            caption_file = self.write_captions(window, prefix + ".ass", prefix + ".srt")
+        self.write_filter_script(prefix + ".txt", prefix + ".cmd", track.window(start, end), end - start, caption_file, lambda msg: None)
+        if speed != 1:
+            with open(prefix + ".txt", 'a', encoding="utf-8") as f: f.write(f"\n[outv] setpts=(PTS-STARTPTS)/{speed:g} [sped];")
+        return prefix + ".txt"
+
+    def _range_audio(self, ranges, first_input):
+        # Inputs and map args for the source audio, or for just the kept ranges joined in order
+        audio = os.path.join(self.segment_dir, 'audio-input.ogg')
+        if not ranges: return ['-i', audio], ['-map', f"{first_input}:a"]
+        inputs = [arg for start, end, _ in ranges for arg in ('-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', audio)]
+        return inputs, ['-filter_complex', audio_mix.range_graph([speed for *_, speed in ranges], first_input) + " [a]", '-map', '[a]']
+
+    def _jump_cut(self, ranges, log):
+        # Drops (or speeds up) dead spans found by idle_detect inside the ranges
+        try:
+            with self._stage("jump_cut.analyze"):
+                analysis = idle_detect.analyze(self.segment_dir, self.jump_cut_min, self.jump_cut_padding, log=log)
+        except RuntimeError as e:
+            log(f"[WARN] Jump-cut analysis failed ({e}), rendering without cuts")
+            return ranges
+        before = ranges_length(ranges)
+        ranges = normalize_ranges(idle_detect.jump_cut(ranges, analysis['dead'], self.jump_cut_speed if self.jump_cuts == "speed" else None))
+        after = ranges_length(ranges)
+        verb = f"sped up {self.jump_cut_speed:g}x" if self.jump_cuts == "speed" else "cut"
+        log(f"[Jump-cut] {len(analysis['dead'])} dead spans {verb}: {format_seconds(before - after)} removed "
+            f"({100 * (before - after) / before if before else 0:.0f}%), {format_seconds(before)} -> {format_seconds(after)}")
+        return ranges
+
+    def _trim_captions(self, ranges, work_dir, log):
+        # A transcript computed ahead is cut to the ranges; otherwise only the kept audio is transcribed
+        if self.segment_dir in self.transcripts: return cut_segments(self.transcripts[self.segment_dir], ranges)
+        excerpt = os.path.join(work_dir, "excerpt.wav")
+        inputs, audio_map = self._range_audio(ranges, 0)
+        returncode, output_log = self._run_ffmpeg(['ffmpeg', '-y', *inputs, *audio_map, '-ac', '1', '-ar', '16000', excerpt], show_progress=False,
+                                                  stage="ffmpeg.excerpt", ranges=len(ranges))
+        if returncode != 0:
+            log("[WARN] Could not extract the kept audio:\n" + "".join(output_log[-10:]))
+            return None
+        return self.iter_transcript(log, excerpt)
+
+    def _chunk_key(self, cache, prefix, start, end, codec):
+        # Everything the chunk's ffmpeg run reads; working-file paths are blanked so the key
+        # doesn't depend on where the output goes
+        def content(path):
+            if not os.path.exists(path): return ""
+            with open(path, 'r', encoding="utf-8") as f: return f.read().replace(_filter_path(prefix), "").replace(prefix, "")
+        sources = [cache.source_digest(os.path.join(self.segment_dir, name), start, end) for name in ('display.mp4', 'camera.mp4')]
+        images = [os.path.basename(self.cursor_atlas()), os.path.basename(self.camera_mask() or "")]
+        return cache.key(*sources, *images, content(prefix + ".txt"), content(prefix + ".cmd"), content(prefix + ".ass"),
+                         f"{end - start:.3f}", *self._codec_args(codec), self.chunk_gop_seconds)
+
+    # --- Preview ---
+    # K short windows spread over the timeline, each input-seeked with its own rebased tracks,
+    # rendered in parallel at reduced size with a fast preset and joined into one file.
+
+    def _preview_args(self):
+        return ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '30', '-c:a', 'aac', '-b:a', '96k']
+
+    def _scaled(self, scale):
+        # A copy compositing on this canvas scaled by `scale`, so display, camera, cursor and
+        # captions are all laid out at that size instead of downscaled from a full-size frame
+        canvas, sub = self.canvas(), copy.copy(self)
+        sub.output_width, sub.output_height = _even(canvas['width'] * scale), _even(canvas['height'] * scale)
+        return sub
+
+    def _preview_captions(self, log):
+        if not self.enable_caption: return None
+        segments = self._caption_segments(callback=log)
+        return list(segments) if segments is not None else None
+
+    def generate_preview(self, output_file="preview.mp4", windows=None, window_seconds=None, callback=None):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        started = time.time()
+        windows, window_seconds = windows or self.preview_windows, window_seconds or self.preview_window_seconds
+        sub = self._scaled(self.preview_scale)
+        track = sub.load_track(None, log)
+        if track is None: return False
+        total = probe_duration(os.path.join(self.segment_dir, 'display.mp4')) or track.times[-1]
+        if total <= 0:
+            log("[ERROR] Recording is empty, nothing to preview")
+            return False
+        segments = self._preview_captions(log)
+
+        starts, length = sample_windows(total, windows, window_seconds)
+        k = len(starts)
+        work_dir = os.path.splitext(output_file)[0] + "_preview"
+        os.makedirs(work_dir, exist_ok=True)
+        jobs = []
+        for j, start in enumerate(starts):
+            prefix = os.path.join(work_dir, f"window_{j:03d}")
+            sub._write_window(prefix, track, segments, start, start + length)
+            jobs.append((j, start, prefix))
+
+        def render_window(job):
+            j, start, prefix = job
+            cmd = ['ffmpeg', '-y', *sub._inputs(start, length), '-/filter_complex', prefix + ".txt", '-map', '[outv]', '-map', '2:a',
+                   *self._preview_args(), '-t', f"{length:.3f}", prefix + ".mp4"]
+            returncode, output_log = self._run_ffmpeg(cmd, show_progress=False, on_progress=lambda p: tracker.update(j, p))
+            if returncode != 0: log(f"[WARN] Preview window {j + 1} failed:\n" + "".join(output_log[-10:]))
+            return returncode == 0
+
+        log(f"[Preview] {k} windows of {length:.1f}s at {self.preview_scale:g}x size")
+        tracker = ProgressTracker(k * length, self._progress_sink())
+        workers = min(k, max(1, (os.cpu_count() or 2) // 2))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if not all(pool.map(render_window, jobs)): return False
+        tracker.finish()
+
+        list_file = os.path.join(work_dir, "concat.txt")
+        with open(list_file, 'w', encoding="utf-8") as f:
+            for j, *_ in jobs: f.write(f"file 'window_{j:03d}.mp4'\n")
+        returncode, output_log = self._run_ffmpeg(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', output_file], show_progress=False)
+        if returncode != 0:
+            log("\nError Output:\n" + "".join(output_log[-20:]))
+            return False
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log(f"[Preview] {k * length:.0f}s of {total:.0f}s sampled in {time.time() - started:.1f}s")
+        return True
+
+    def render_still(self, t, output_file="still.png", scale=None, callback=None):
+        # One composited frame at time t (seconds); returns the image path or None
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        sub = self._scaled(scale) if scale else self
+        track = sub.load_track(t + 1.0, lambda msg: None)
+        if track is None: return None
+        prefix = os.path.splitext(output_file)[0] + "_still"
+        sub._write_window(prefix, track, self._preview_captions(log), t, t + 1.0)
+        cmd = ['ffmpeg', '-y', *sub._inputs(t, 1.0), '-/filter_complex', prefix + ".txt", '-map', '[outv]',
+               '-frames:v', '1', output_file]
+        returncode, output_log = self._run_ffmpeg(cmd, show_progress=False)
+        for ext in (".txt", ".cmd", ".ass", ".srt"):
+            if os.path.exists(prefix + ext): os.remove(prefix + ext)
+        if returncode != 0:
+            log("\nError Output:\n" + "".join(output_log[-20:]))
+            return None
+        return output_file
+
+    # --- Multi-Segment Projects ---
+    # Each segment is rendered on its own (own cursor data and graph, in parallel) into
+    # <project>/.render/segment-N, then the results are joined with stream copy. A segment
+    # whose inputs and settings match its manifest from the last run is reused as is.
+
+    def settings_key(self, **extra):
+        keys = ['output_width', 'output_height', 'output_fps', 'cam_scale_w', 'cam_scale_h', 'cursor_scale', 'click_scale', 'cam_shape', 'cam_radius', 'cam_feather', 'cam_margin_x', 'cam_margin_y', 'cam_position',
+                'enable_caption', 'caption_font', 'caption_size', 'caption_color', 'caption_outline_color', 'caption_pos',
+                'whisper_model', 'use_faster_whisper', 'caption_language', 'whisper_parallel', 'whisper_chunk_seconds', 'cursor_mode', 'track_fps', 'cursor_tolerance_px',
+                'encoder_profiles', 'auto_tune', 'tune_min_ssim', 'tune_samples', 'tune_sample_seconds',
+                'cache_audio', 'audio_bitrate', 'voice_lufs', 'music_file', 'music_lufs', 'music_duck', 'music_offset', 'renditions',
+                'chunked', 'chunk_count', 'chunk_workers', 'chunk_gop_seconds', 'incremental', 'incremental_chunk_seconds', 'keep_ranges',
+                'jump_cuts', 'jump_cut_min', 'jump_cut_padding', 'jump_cut_speed']
+        if not (self.chunked or self.incremental or self.keep_ranges or self.jump_cuts):
+            # Single-pass renders don't depend on the chunk layout (chunk_workers varies with the batch share)
+            keys = [k for k in keys if k not in ('chunk_count', 'chunk_workers', 'chunk_gop_seconds', 'incremental_chunk_seconds')]
+        return {**{k: getattr(self, k) for k in keys}, **extra}
+
+    def _segment_inputs_key(self, segment_dir):
+        files = [os.path.join(segment_dir, n) for n in ('display.mp4', 'camera.mp4', 'audio-input.ogg', 'cursor.json')]
+        files += [os.path.join(self.cursor_dir, f'cursor_{i}.png') for i in range(11)]
+        if self.music_file: files.append(self.music_file)
+        stats = []
+        for path in files:
+            try: st = os.stat(path); stats.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+            except OSError: stats.append([os.path.basename(path), None, None])
+        return stats
+
+    def generate_segments(self, output_file="output_rendered.mp4", duration_limit=None, callback=None, use_hevc=False):
+        def log(msg):
+            if callback: callback(msg)
+            else: print(msg.strip())
+
+        cache_dir = os.path.join(self.project_dir, '.render')
+        n = len(self.segment_dirs)
+        log(f"[Segments] {n} segments found")
+        if self.stream_output and not self.renditions: log("[WARN] Streaming output of a multi-segment project starts only when all segments are joined")
+        # Tuned once here (on the first segment) so parallel segments don't benchmark against each other
+        if self.auto_tune: self.tune_encoder(self._pick_codec(use_hevc, log), log)
+
+        # Offsets come from the source durations so a duration limit can be spread across segments
+        durations = [probe_duration(os.path.join(d, 'display.mp4')) for d in self.segment_dirs]
+        # keep_ranges are on the joined timeline; each segment gets its part, rebased to its own start
+        ranges = normalize_ranges(self.keep_ranges, sum(d or 0.0 for d in durations), duration_limit) if self.keep_ranges else None
+        if ranges:
+            # Segments are joined in recording order, so ranges only keep their order within a segment
+            ends = [sum(d or 0.0 for d in durations[:i + 1]) for i in range(n)]
+            order = [bisect.bisect_right(ends, start) for start, *_ in ranges]
+            if order != sorted(order): log("[WARN] Keep ranges that jump back to an earlier segment are joined in recording order")
+        jobs, offset = [], 0.0
+        for i, seg_dir in enumerate(self.segment_dirs):
+            limit, seg_ranges = None, None
+            if ranges is not None:
+                seg_ranges = normalize_ranges([(s - offset, e - offset, sp) for s, e, sp in ranges], durations[i] or 0.0)
+                if seg_ranges == [(0.0, durations[i], 1.0)]: seg_ranges = None
+                elif not seg_ranges:
+                    offset += durations[i] or 0.0
+                    continue
+            elif duration_limit:
+                if offset >= duration_limit: break
+                limit = duration_limit - offset
+                if durations[i] and limit >= durations[i]: limit = None
+            jobs.append((i, seg_dir, limit, seg_ranges))
+            offset += durations[i] or 0.0
+        if not jobs:
+            log("[Trim] No keep-range overlaps the recording")
+            return False
+
+        def render_segment(job):
+            i, seg_dir, limit, seg_ranges = job
+            name = os.path.basename(seg_dir)
+            work = os.path.join(cache_dir, name)
+            os.makedirs(work, exist_ok=True)
+            out = os.path.join(work, "render.mp4")
+            manifest_path = os.path.join(work, "manifest.json")
+            sub = copy.copy(self)
+            sub.segment_dirs, sub.segment_dir, sub.work_dir, sub.keep_ranges = [seg_dir], seg_dir, work, seg_ranges
+            sub.music_offset = self.music_offset + out_offsets[i]
+            sub.stream_output = None
+            # Segments render side by side, so they split the chunk workers and NVENC sessions
+            sub.chunk_workers = max(1, (self.chunk_workers or max(1, (os.cpu_count() or 2) // 4)) // workers)
+            sub.nvenc_sessions = max(1, self.nvenc_sessions // workers)
+            # Keyed on the settings the segment actually renders with; the music offset only matters with music
+            settings = sub.settings_key(use_hevc=use_hevc, duration_limit=limit, music_offset=sub.music_offset if self.music_file else None)
+            key = hashlib.sha256(json.dumps({'settings': settings,
+                                             'inputs': self._segment_inputs_key(seg_dir)}, sort_keys=True).encode()).hexdigest()
+            if all(os.path.exists(path) for path in self.output_paths(out)) and os.path.exists(manifest_path):
+                with open(manifest_path, 'r', encoding="utf-8") as f:
+                    if json.load(f).get('key') == key:
+                        log(f"[Segments] {name} unchanged, reusing previous render")
+                        tracker.update(i, Progress(out_time=kept_length(job), done=True))
+                        return out
+            sub.progress_callback = lambda p: tracker.update(i, p)
+            if os.path.exists(os.path.join(work, "captions.json")): os.remove(os.path.join(work, "captions.json"))
+            ok = sub.generate_script(out, duration_limit=limit, callback=lambda msg: log(f"[{name}] {msg.strip()}"), use_hevc=use_hevc)
+            if not ok: return None
+            with open(manifest_path, 'w', encoding="utf-8") as f: json.dump({'key': key}, f)
+            return out
+
+        def kept_length(job):
+            i, _, limit, seg_ranges = job
+            return ranges_length(seg_ranges) if seg_ranges else limit or durations[i] or 0.0
+
+        total = sum(kept_length(job) for job in jobs)
+        out_offsets, offset = {}, 0.0
+        for job in jobs:
+            out_offsets[job[0]] = offset
+            offset += kept_length(job)
+        tracker = ProgressTracker(total, self._progress_sink())
+        workers = self.segment_workers or min(len(jobs), max(1, (os.cpu_count() or 2) // 4))
+        if self.has_nvenc: workers = min(workers, max(1, self.nvenc_sessions))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(render_segment, jobs))
+        if not all(outputs): return False
+        tracker.finish()
+
+        # Captions: merge every segment's transcript at the offset where it lands in the output
+        if self.enable_caption:
+            merged, offset = [], 0.0
+            for (i, *_), out in zip(jobs, outputs):
+                captions_json = os.path.join(os.path.dirname(out), "captions.json")
+                if os.path.exists(captions_json):
+                    with open(captions_json, 'r', encoding="utf-8") as f:
+                        merged.extend({'start': c['start'] + offset, 'end': c['end'] + offset, 'text': c['text']} for c in json.load(f))
+                offset += probe_duration(self.output_paths(out)[0]) or durations[i] or 0.0
+            ass_path = self.write_captions(merged)
+            log(f"[AI] Saved captions to {ass_path}")
+
+        # One join per rendition (just the output file without renditions)
+        log("[Segments] Joining segments...")
+        for k, final in enumerate(self.output_paths(output_file)):
+            list_file = os.path.join(cache_dir, f"concat_{k}.txt")
+            with open(list_file, 'w', encoding="utf-8") as f:
+                for out in outputs: f.write(f"file '{os.path.relpath(self.output_paths(out)[k], cache_dir).replace(os.sep, '/')}'\n")
+            # Renditions stay plain MP4s; otherwise the joined file is also streamed out
+            streamed = self.stream_output and not self.renditions
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_file, '-map', '0', '-c', 'copy', *(self._output_args(final) if streamed else [final])]
+            with self._stream_watch(final, log) if streamed else contextlib.nullcontext():
+                returncode, output_log = self._run_ffmpeg(cmd, show_progress=False, stage="ffmpeg.join", segments=len(outputs))
+            if returncode != 0:
+                log("\nError Output:\n" + "".join(output_log[-20:]))
+                return False
+        return True
+
+def _write_filter_lines(f, lines):
+    # Lines are plain strings or lists of strings and expression writers
+    for i, line in enumerate(lines):
+        if i: f.write("\n")
+        for part in ([line] if isinstance(line, str) else line):
+            if callable(part): part(f)
+            else: f.write(part)
+
+def rendition_path(output_file, name):
+    base, ext = os.path.splitext(output_file)
+    return f"{base}_{name}{ext or '.mp4'}"
+
+def discover_segments(project_dir):
+    root = os.path.join(project_dir, 'segments')
+    found = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            m = re.fullmatch(r'segment-(\d+)', name)
+            if m and os.path.isdir(os.path.join(root, name)): found.append((int(m.group(1)), os.path.join(root, name)))
+    return [path for _, path in sorted(found)] or [os.path.join(root, 'segment-0')]
+
+def _filter_path(path):
+    # Path usable inside a filtergraph option value (Windows separators and drive colons)
+    return path.replace("\\", "/").replace(":", "\\:")
+
+def rebase_segments(segments, start, end):
+    # Caption segments overlapping [start, end), clipped and shifted so `start` becomes 0
+    out = []
+    for seg in segments:
+        if seg['end'] <= start or seg['start'] >= end: continue
+        out.append({'start': max(seg['start'], start) - start, 'end': min(seg['end'], end) - start, 'text': seg['text']})
+    return out
+
+def sample_windows(total, count, length):
+    # Start times of up to `count` windows of `length` seconds spread evenly over [0, total]
+    length = min(length, total)
+    if length <= 0: return [0.0], 0.0
+    k = max(1, min(count, int(total // length)))
+    return ([0.0] if k == 1 else [(total - length) * j / (k - 1) for j in range(k)]), length
+
+def cut_segments(segments, ranges):
+    # Caption segments on the source timeline -> the output timeline of `ranges` joined in order
+    out, offset = [], 0.0
+    for start, end, speed in ranges:
+        out.extend({'start': seg['start'] / speed + offset, 'end': seg['end'] / speed + offset, 'text': seg['text']}
+                   for seg in rebase_segments(segments, start, end))
+        offset += (end - start) / speed
+    return out
+
+def parse_time(text):
+    # "ss", "mm:ss" or "hh:mm:ss" (fractions allowed) -> seconds
+    seconds = 0.0
+    for part in text.strip().split(":"): seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_ranges(text):
+    # "0:10-1:30, 5:00-" -> [(10.0, 90.0), (300.0, inf)]; an empty end means the end of the recording
+    ranges = []
+    for item in re.split(r"[,;\n]", text or ""):
+        if not item.strip(): continue
+        start, sep, end = item.partition("-")
+        if not sep: raise ValueError(f"Invalid range (expected start-end): {item.strip()}")
+        start, end = parse_time(start) if start.strip() else 0.0, parse_time(end) if end.strip() else math.inf
+        if end < start: raise ValueError(f"Invalid range (end before start): {item.strip()}")
+        ranges.append((start, end))
+    return ranges or None
+
+def normalize_ranges(ranges, total=None, limit=None):
+    # (start, end) or (start, end, speed) entries -> (start, end, speed) clipped to [0, total], in the
+    # given order (they are joined in that order). A range starting inside the one before it is merged
+    # into it (equal speed) or trimmed to start where it ends; `limit` caps the output length.
+    out = []
+    for start, end, speed in ((max(float(r[0]), 0.0), float(r[1]), float(r[2]) if len(r) > 2 else 1.0) for r in ranges):
+        if total: end = min(end, total)
+        if out and out[-1][0] <= start <= out[-1][1]:
+            if speed == out[-1][2]:
+                out[-1] = (out[-1][0], max(out[-1][1], end), speed)
+                continue
+            start = out[-1][1]
+        if end <= start: continue
+        out.append((start, end, speed))
+    if limit:
+        capped, kept = [], 0.0
+        for start, end, speed in out:
+            if kept >= limit: break
+            capped.append((start, min(end, start + (limit - kept) * speed), speed))
+            kept += (capped[-1][1] - start) / speed
+        out = capped
+    return out
+
+def ranges_length(ranges):
+    # Output seconds of normalized ranges
+    return sum((end - start) / speed for start, end, speed in ranges)
+
+def split_ranges(ranges, length):
+    # Pieces of at most `length` output seconds as (source start, source end, output start, speed)
+    pieces, offset = [], 0.0
+    for start, end, speed in ranges:
+        t = start
+        while t < end:
+            pieces.append((t, min(t + length * speed, end), offset + (t - start) / speed, speed))
+            t += length * speed
+        offset += (end - start) / speed
+    return pieces
+
+_atlas_lock = threading.Lock()
+
+def cursor_atlas_path(cursor_dir, size, pressed_scale=0.85, count=11, stage=contextlib.nullcontext):
+    # One RGBA image: `count` cursors at size x size, then the same cursors scaled by
+    # pressed_scale and padded back to size x size. Cached by cursor file contents and sizes;
+    # stage() wraps the build only, not cache hits.
+    files = [os.path.join(cursor_dir, f'cursor_{i}.png') for i in range(count)]
+    key = render_cache.text_digest(*(render_cache.file_digest(f) for f in files), size, pressed_scale)
+    path = os.path.join(render_cache.cache_dir("atlases"), f"cursors_{size}_{key[:16]}.png")
+    with _atlas_lock:
+        if os.path.exists(path): return path
+        with stage(): _build_atlas(path, files, size, pressed_scale, count)
+    return path
+
+def _build_atlas(path, files, size, pressed_scale, count):
+    pressed = max(2, round(size * pressed_scale) // 2 * 2)
+    inputs, filters, rows, pressed_rows = [], [], "", ""
+    for i, f in enumerate(files):
+        inputs.extend(['-i', f])
+        filters.append(f"[{i}:v] scale={size}:{size}:force_original_aspect_ratio=decrease, pad={size}:{size}:(ow-iw)/2:(oh-ih)/2:color=black@0, format=rgba, split [c{i}][s{i}];")
+        filters.append(f"[s{i}] scale={pressed}:{pressed}, pad={size}:{size}:(ow-iw)/2:(oh-ih)/2:color=black@0 [p{i}];")
+        rows += f"[c{i}]"
+        pressed_rows += f"[p{i}]"
+    filters.append(f"{rows}{pressed_rows} vstack=inputs={2 * count}, format=rgba [atlas]")
+    # _atlas_lock only covers this process; other renders sharing the cache write their own temp file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp.png")
+    os.close(fd)
+    res = subprocess.run(['ffmpeg', '-y', '-v', 'error', *inputs, '-filter_complex', "\n".join(filters),
+                          '-map', '[atlas]', '-frames:v', '1', tmp], capture_output=True, text=True)
+    if res.returncode != 0:
+        os.remove(tmp)
+        raise RuntimeError(f"Could not build cursor atlas: {res.stderr.strip()}")
+    os.replace(tmp, path)
+
+def camera_mask_alpha(shape, w, h, radius=20, feather=0):
+    # Same inside test as the old per-pixel geq (pixel (X,Y) vs centre (w/2,h/2)), 8-bit rows
+    cx, cy = w / 2, h / 2
+    if shape == "circle": r, in_x, in_y = min(w, h) / 2, 0, 0
+    else: r, in_x, in_y = radius, cx - radius, cy - radius
+    out = bytearray(w * h)
+    for y in range(h):
+        dy = max(0.0, abs(y - cy) - in_y)
+        for x in range(w):
+            dx = max(0.0, abs(x - cx) - in_x)
+            d = math.sqrt(dx * dx + dy * dy)
+            if feather > 0: a = min(1.0, max(0.0, 0.5 + (r - d) / feather))
+            else: a = 1.0 if d <= r else 0.0
+            out[y * w + x] = int(a * 255 + 0.5)
+    return out
+
+def camera_mask_path(shape, w, h, radius=20, feather=0):
+    # Masks depend only on these parameters, so they are generated once and kept in the render cache
+    name = f"{shape}_{w}x{h}_r{radius}_f{feather}.pgm" if shape == "rounded" else f"{shape}_{w}x{h}_f{feather}.pgm"
+    path = os.path.join(render_cache.cache_dir("masks"), name)
+    if not os.path.exists(path):
+        # Chunk workers may ask for the same mask at once; each writes its own temp file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(f"P5\n{w} {h}\n255\n".encode("ascii"))
+            f.write(camera_mask_alpha(shape, w, h, radius, feather))
+        os.replace(tmp, path)
+    return path
+
+def probe_duration(path):
+    return (probe.media_info(path) or {}).get('duration')
+
+def _even(value):
+    return max(2, int(round(value / 2)) * 2)
+
 if __name__ == "__main__":
     renderer = VideoRenderer(os.getcwd())
     renderer.generate_script("output_click_test.mp4", duration_limit=60)